@@ -1,5 +1,7 @@
 import threading
 
+from .log import create_logger, DEBUG, INFO, WARNING, ERROR
+
 screen_lock = threading.Semaphore(value=1)
 
 old_print = print
@@ -12,3 +14,6 @@ def print_sync(*args, **kwargs):
 
 
 connections = []
+connections_lock = threading.Lock()
+
+logger = create_logger(lock=screen_lock)
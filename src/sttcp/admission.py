@@ -0,0 +1,220 @@
+import threading
+import time
+from typing import Union
+
+
+class RateLimitError(ConnectionAbortedError):
+    """Passed to `disconnection_handler` when a peer exceeded its rate limit and `throttle` is disabled."""
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Union[float, None] = None):
+        """
+        Token bucket refilled with `rate` tokens per second up to `burst` tokens (one second of `rate` by default).
+        """
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self.tokens = self.burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def consume(self, amount: float) -> float:
+        """
+        Takes `amount` tokens even if there are not enough of them.
+        :return: Seconds to wait until the bucket is not in debt, 0 if there were enough tokens
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_consume(self, amount: float) -> bool:
+        """Takes `amount` tokens only if there are enough of them"""
+        with self._lock:
+            self._refill()
+            if self.tokens < amount:
+                return False
+            self.tokens -= amount
+            return True
+
+    @property
+    def full(self) -> bool:
+        """True when the bucket has refilled up to `burst`, so dropping it doesn't let the peer send more"""
+        with self._lock:
+            self._refill()
+            return self.tokens >= self.burst
+
+    def try_borrow(self, amount: float) -> bool:
+        """
+        Takes `amount` tokens if the bucket is not in debt, even if it goes into debt by them. Amounts bigger than
+        `burst` (like a whole received chunk) pass when the average rate is within the limit.
+        """
+        with self._lock:
+            self._refill()
+            if self.tokens <= 0:
+                return False
+            self.tokens -= amount
+            return True
+
+
+class _Peer:
+    __slots__ = ('connections', 'bytes', 'messages')
+
+    def __init__(self, bytes_bucket: Union[TokenBucket, None], messages_bucket: Union[TokenBucket, None]):
+        self.connections = 0
+        self.bytes = bytes_bucket
+        self.messages = messages_bucket
+
+    @property
+    def idle(self) -> bool:
+        """No connections and no rate debt left, so the peer can be forgotten"""
+        return not self.connections and (self.bytes is None or self.bytes.full) and \
+            (self.messages is None or self.messages.full)
+
+
+class AdmissionControl:
+    def __init__(self, max_connections: Union[int, None] = None, max_per_peer: Union[int, None] = None,
+                 bytes_per_second: Union[float, None] = None, messages_per_second: Union[float, None] = None,
+                 burst: float = 1.0, throttle: bool = True, shed_when_saturated: bool = True):
+        """
+        Limits of `sttcp.server.Server` connections. Connections over a limit are closed right after `accept`, before
+        a thread is taken and before any handler runs. Peers are IP addresses (unix socket clients are one peer).
+        Rates of a peer are kept after its last connection closes until its buckets are full again, so reconnecting
+        doesn't reset them.
+        :param max_connections: Maximum amount of connected clients
+        :param max_per_peer: Maximum amount of connections of one peer
+        :param bytes_per_second: Received bytes rate of one peer (all its connections together)
+        :param messages_per_second: Received messages rate of one peer (chunks without framer)
+        :param burst: Seconds of rate a peer may send at once
+        :param throttle: Stop reading from a peer over its rate until it is allowed again, so TCP slows the sender
+        down. If False the connection is closed with `RateLimitError`
+        :param shed_when_saturated: Reject connections while the server worker pool is saturated
+        """
+        self.max_connections = max_connections
+        self.max_per_peer = max_per_peer
+        self.bytes_per_second = bytes_per_second
+        self.messages_per_second = messages_per_second
+        self.burst = burst
+        self.throttle = throttle
+        self.shed_when_saturated = shed_when_saturated
+
+        self._lock = threading.Lock()
+        self._peers = {}
+        self._pruned = time.monotonic()
+        self.connections = 0
+
+        self.admitted = 0
+        self.rejected_total = 0
+        self.rejected_peer = 0
+        self.rejected_overload = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.limited = 0
+
+    @staticmethod
+    def peer(addr) -> object:
+        """Returns the key limits are counted by: IP address of TCP clients, the address itself otherwise"""
+        return addr[0] if isinstance(addr, tuple) and addr and isinstance(addr[0], str) else addr
+
+    def _bucket(self, rate: Union[float, None]) -> Union[TokenBucket, None]:
+        return None if rate is None else TokenBucket(rate, rate * self.burst)
+
+    def _prune(self):
+        """Forgets disconnected peers whose buckets refilled. Runs at most once per `burst` seconds"""
+        now = time.monotonic()
+        if now - self._pruned < self.burst:
+            return
+        self._pruned = now
+        for key in [key for key, peer in self._peers.items() if peer.idle]:
+            del self._peers[key]
+
+    def admit(self, addr, overloaded: bool = False) -> bool:
+        """
+        Counts a new connection. Returns False without counting it if a limit is reached.
+        :param overloaded: The server can't take more work now (like a saturated worker pool)
+        """
+        key = self.peer(addr)
+        with self._lock:
+            self._prune()
+            if overloaded and self.shed_when_saturated:
+                self.rejected_overload += 1
+                return False
+            if self.max_connections is not None and self.connections >= self.max_connections:
+                self.rejected_total += 1
+                return False
+            peer = self._peers.get(key)
+            if peer is None:
+                peer = self._peers[key] = _Peer(self._bucket(self.bytes_per_second),
+                                                self._bucket(self.messages_per_second))
+            elif self.max_per_peer is not None and peer.connections >= self.max_per_peer:
+                self.rejected_peer += 1
+                return False
+            peer.connections += 1
+            self.connections += 1
+            self.admitted += 1
+            return True
+
+    def release(self, addr) -> None:
+        """Forgets a connection counted by `admit`"""
+        key = self.peer(addr)
+        with self._lock:
+            peer = self._peers.get(key)
+            if peer is None:
+                return
+            peer.connections -= 1
+            self.connections -= 1
+            if peer.idle:
+                del self._peers[key]
+
+    def limit(self, addr, received: int, messages: int = 1) -> float:
+        """
+        Counts received data of a peer.
+        :return: Seconds to wait before reading again (0 if the peer is within limits) or -1 if it must be
+        disconnected
+        """
+        peer = self._peers.get(self.peer(addr))
+        if peer is None or (peer.bytes is None and peer.messages is None):
+            return 0.0
+
+        if not self.throttle:
+            if (peer.bytes is None or not received or peer.bytes.try_borrow(received)) and \
+                    (peer.messages is None or not messages or peer.messages.try_borrow(messages)):
+                return 0.0
+            with self._lock:
+                self.limited += 1
+            return -1.0
+
+        delay = 0.0
+        if peer.bytes is not None and received:
+            delay = peer.bytes.consume(received)
+        if peer.messages is not None and messages:
+            delay = max(delay, peer.messages.consume(messages))
+        if delay:
+            with self._lock:
+                self.throttled += 1
+                self.throttled_seconds += delay
+        return delay
+
+    def stats(self) -> dict:
+        """Returns current connections, remembered peers and counters of shed traffic"""
+        with self._lock:
+            return {
+                'connections': self.connections,
+                'peers': len(self._peers),
+                'admitted': self.admitted,
+                'rejected': self.rejected_total + self.rejected_peer + self.rejected_overload,
+                'rejected_total': self.rejected_total,
+                'rejected_peer': self.rejected_peer,
+                'rejected_overload': self.rejected_overload,
+                'throttled': self.throttled,
+                'throttled_seconds': self.throttled_seconds,
+                'limited': self.limited,
+            }
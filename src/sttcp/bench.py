@@ -0,0 +1,306 @@
+"""
+Loopback benchmarks of simple-threaded-tcp.
+
+Usage: python -m sttcp.bench [latency] [throughput] [churn] [concurrency] [--engine threaded|event] [--output file]
+
+Results are printed (or written to `--output`) as JSON. Benchmarks which didn't finish in `--timeout` seconds have
+`"complete": false` and the exit code is 1.
+"""
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+from typing import Union
+try:
+    from . import logger, WARNING
+    from .server import Server
+    from .client import Client
+    from .event import EventServer
+except ImportError:
+    from sttcp import logger, WARNING
+    from sttcp.server import Server
+    from sttcp.client import Client
+    from sttcp.event import EventServer
+
+BENCHMARKS = ('latency', 'throughput', 'churn', 'concurrency')
+ENGINES = ('threaded', 'event')
+TIMEOUT = 60.0
+
+
+def percentiles(samples: list, points=(50, 90, 99, 99.9)) -> dict:
+    """Returns `{"p50": ..., "max": ...}` of `samples`"""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    result = {}
+    for point in points:
+        index = round(point / 100 * (len(samples) - 1))
+        result['p' + format(point, 'g')] = samples[index]
+    result['min'] = samples[0]
+    result['max'] = samples[-1]
+    result['mean'] = sum(samples) / len(samples)
+    return result
+
+
+def _create_server(engine: str, receive_handler, **options):
+    if engine == 'event':
+        server = EventServer('127.0.0.1', 0, **options)
+    else:
+        server = Server('127.0.0.1', 0, **options)
+    server.receive_handler(receive_handler)
+    server.disconnection_handler(lambda addr, reason: None)
+    server.start()
+    if not server.wait_listening(5):
+        raise RuntimeError('Benchmark server did not start')
+    return server
+
+
+def _remaining(deadline: float) -> float:
+    return max(0.0, deadline - time.perf_counter())
+
+
+def _echo(addr, connection, data):
+    connection.sendall(data)
+
+
+def _ping_client(port: int, rounds: int, size: int, latencies: list, **options) -> Client:
+    payload = b'x' * size
+    state = {'received': 0, 'left': rounds, 'sent_at': 0.0}
+
+    client = Client('127.0.0.1', port, **options)
+
+    @client.connection_handler
+    def connection_handler(addr, connection):
+        state['sent_at'] = time.perf_counter()
+        connection.sendall(payload)
+        return True
+
+    @client.response_handler
+    def response_handler(addr, connection, data):
+        state['received'] += len(data)
+        if state['received'] < size:
+            return True
+        latencies.append(time.perf_counter() - state['sent_at'])
+        state['received'] = 0
+        state['left'] -= 1
+        if not state['left']:
+            return False
+        state['sent_at'] = time.perf_counter()
+        connection.sendall(payload)
+        return True
+
+    client.disconnection_handler(lambda addr, reason: None)
+    return client
+
+
+def bench_latency(engine: str = 'threaded', rounds: int = 2000, size: int = 64, server_options: dict = None,
+                  client_options: dict = None, timeout: float = TIMEOUT) -> dict:
+    """Echo round trip latency of one connection, in seconds. Stops after `timeout` with `"complete": false`"""
+    server = _create_server(engine, _echo, **(server_options or {}))
+    try:
+        latencies = []
+        client = _ping_client(server.sock_name[1], rounds, size, latencies, **(client_options or {}))
+        started = time.perf_counter()
+        client.start()
+        complete = client.wait_closed(timeout)
+        elapsed = time.perf_counter() - started
+        if not complete:
+            client.close()
+    finally:
+        server.close()
+        server.wait_closed()
+
+    return {'complete': complete, 'rounds': len(latencies), 'size': size, 'elapsed': elapsed,
+            'round_trips_per_second': len(latencies) / elapsed, 'latency': percentiles(latencies)}
+
+
+def bench_throughput(engine: str = 'threaded', total: int = 256 * 1024 * 1024, chunk_size: int = 64 * 1024,
+                     server_options: dict = None, client_options: dict = None, timeout: float = TIMEOUT) -> dict:
+    """Bulk transfer speed from client to server. Stops after `timeout` with `"complete": false`"""
+    lock = threading.Lock()
+    state = {'received': 0}
+    done = threading.Event()
+    stopped = threading.Event()
+
+    def count(addr, connection, data):
+        with lock:
+            state['received'] += len(data)
+            if state['received'] >= total:
+                done.set()
+
+    server = _create_server(engine, count, **(server_options or {}))
+    try:
+        chunk = memoryview(b'x' * chunk_size)
+        client = Client('127.0.0.1', server.sock_name[1], **(client_options or {}))
+
+        @client.connection_handler
+        def connection_handler(addr, connection):
+            left = total
+            while left > 0 and not stopped.is_set():
+                connection.sendall(chunk[:min(left, chunk_size)])
+                left -= chunk_size
+            done.wait(timeout)
+            return False
+
+        client.disconnection_handler(lambda addr, reason: None)
+        client.unconnected_handler(lambda addr, e: None)
+
+        started = time.perf_counter()
+        client.start()
+        complete = done.wait(timeout)
+        elapsed = time.perf_counter() - started
+        if not complete:
+            stopped.set()
+        client.wait_closed(timeout)
+    finally:
+        server.close()
+        server.wait_closed()
+
+    return {'complete': complete, 'bytes': state['received'], 'chunk_size': chunk_size, 'elapsed': elapsed,
+            'megabytes_per_second': state['received'] / elapsed / 1e6}
+
+
+def bench_churn(engine: str = 'threaded', connections: int = 500, server_options: dict = None,
+                client_options: dict = None, timeout: float = TIMEOUT) -> dict:
+    """Sequential connect and disconnect speed. Stops after `timeout` with `"complete": false`"""
+    server = _create_server(engine, _echo, **(server_options or {}))
+    try:
+        port = server.sock_name[1]
+        durations = []
+        complete = True
+        started = time.perf_counter()
+        deadline = started + timeout
+        for _ in range(connections):
+            client = Client('127.0.0.1', port, **(client_options or {}))
+            client.connection_handler(lambda addr, connection: False)
+            client.disconnection_handler(lambda addr, reason: None)
+            connected = time.perf_counter()
+            client.start()
+            if not client.wait_closed(_remaining(deadline)):
+                client.close()
+                complete = False
+                break
+            durations.append(time.perf_counter() - connected)
+        elapsed = time.perf_counter() - started
+    finally:
+        server.close()
+        server.wait_closed()
+
+    return {'complete': complete, 'connections': len(durations), 'elapsed': elapsed,
+            'connections_per_second': len(durations) / elapsed,
+            'connection_time': percentiles(durations)}
+
+
+def bench_concurrency(engine: str = 'threaded', clients: int = 50, rounds: int = 200, size: int = 64,
+                      server_options: dict = None, client_options: dict = None, timeout: float = TIMEOUT) -> dict:
+    """Echo round trips of many concurrent connections. Stops after `timeout` with `"complete": false`"""
+    server = _create_server(engine, _echo, **(server_options or {}))
+    try:
+        latencies = []
+        workers = [_ping_client(server.sock_name[1], rounds, size, latencies, **(client_options or {}))
+                   for _ in range(clients)]
+        started = time.perf_counter()
+        deadline = started + timeout
+        for client in workers:
+            client.start()
+        complete = True
+        for client in workers:
+            if not client.wait_closed(_remaining(deadline)):
+                client.close()
+                complete = False
+        elapsed = time.perf_counter() - started
+    finally:
+        server.close()
+        server.wait_closed()
+
+    return {'complete': complete, 'clients': clients, 'rounds': len(latencies), 'size': size, 'elapsed': elapsed,
+            'round_trips_per_second': len(latencies) / elapsed, 'latency': percentiles(latencies)}
+
+
+def run(benchmarks=BENCHMARKS, engine: str = 'threaded', server_options: dict = None, client_options: dict = None,
+        **parameters) -> dict:
+    """
+    Runs benchmarks and returns JSON serializable results.
+    :param benchmarks: Names of benchmarks to run, see `BENCHMARKS`
+    :param engine: `"threaded"` for `sttcp.server.Server`, `"event"` for `sttcp.event.EventServer`
+    :param parameters: Benchmark parameters like `rounds`, `size`, `total`, `connections`, `clients`, `timeout`
+    """
+    functions = {'latency': bench_latency, 'throughput': bench_throughput, 'churn': bench_churn,
+                 'concurrency': bench_concurrency}
+    results = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'engine': engine,
+        'server_options': server_options or {},
+        'client_options': client_options or {},
+        'benchmarks': {},
+    }
+
+    level = logger.level
+    logger.level = WARNING
+    try:
+        for name in benchmarks:
+            function = functions[name]
+            accepted = function.__code__.co_varnames[:function.__code__.co_argcount]
+            kwargs = {key: value for key, value in parameters.items() if key in accepted and value is not None}
+            results['benchmarks'][name] = function(engine, server_options=server_options,
+                                                   client_options=client_options, **kwargs)
+    finally:
+        logger.level = level
+    return results
+
+
+def main(argv: Union[list, None] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m sttcp.bench', description='simple-threaded-tcp benchmarks')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help=f'one of {", ".join(BENCHMARKS)} (default: all)')
+    parser.add_argument('--engine', choices=ENGINES, default='threaded')
+    parser.add_argument('--workers', type=int, help='worker pool size of threaded server')
+    parser.add_argument('--buffer-size', type=int, help='receive buffer size')
+    parser.add_argument('--zero-copy', action='store_true', help='receive with recv_into')
+    parser.add_argument('--rounds', type=int, help='round trips per connection')
+    parser.add_argument('--size', type=int, help='round trip message size')
+    parser.add_argument('--total', type=int, help='throughput transfer size in bytes')
+    parser.add_argument('--chunk-size', type=int, help='throughput send chunk size')
+    parser.add_argument('--connections', type=int, help='churn connections amount')
+    parser.add_argument('--clients', type=int, help='concurrent clients amount')
+    parser.add_argument('--timeout', type=float, help=f'seconds each benchmark may run (default: {TIMEOUT:g})')
+    parser.add_argument('--output', help='write JSON to this file instead of stdout')
+    args = parser.parse_args(argv)
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name!r}, choose from {", ".join(BENCHMARKS)}')
+
+    server_options = {}
+    client_options = {}
+    if args.workers is not None:
+        if args.engine != 'threaded':
+            parser.error('--workers is only supported by threaded engine')
+        server_options['workers'] = args.workers
+    if args.buffer_size is not None:
+        server_options['buffer_size'] = args.buffer_size
+        client_options['buffer_size'] = args.buffer_size
+    if args.zero_copy:
+        if args.engine == 'threaded':
+            server_options['zero_copy'] = True
+        client_options['zero_copy'] = True
+
+    results = run(args.benchmarks or BENCHMARKS, args.engine, server_options, client_options,
+                  rounds=args.rounds, size=args.size, total=args.total, chunk_size=args.chunk_size,
+                  connections=args.connections, clients=args.clients, timeout=args.timeout)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+    return 0 if all(result['complete'] for result in results['benchmarks'].values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
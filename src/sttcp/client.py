@@ -1,26 +1,63 @@
+import itertools
 import socket
 import threading
+import time
 import traceback
 import warnings
-import time
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError
 from enum import Enum
 from typing import Union
 try:
-    from . import connections, print_sync
+    from . import connections, connections_lock, logger
+    from .connection import Connection
+    from .framing import FrameTooLargeError
+    from .metrics import Metrics
+    from .timeouts import IdleWatch, KeepAlive, wheel
+    from .framing import LengthPrefixFramer
+    from . import pipeline
+    from .transport import Transport, detect, format_address
+    from .options import SocketOptions
+    from .router import Router
+    from .compression import Compression, CompressionError, check_framer
 except ImportError:
-    from sttcp import connections, print_sync
-
-
-def _default_connection(addr: tuple, connection: socket.socket) -> Union[bool, None]:
-    connection.sendall(b'ok')
+    from sttcp import connections, connections_lock, logger
+    from sttcp.connection import Connection
+    from sttcp.framing import FrameTooLargeError
+    from sttcp.metrics import Metrics
+    from sttcp.timeouts import IdleWatch, KeepAlive, wheel
+    from sttcp.framing import LengthPrefixFramer
+    from sttcp import pipeline
+    from sttcp.transport import Transport, detect, format_address
+    from sttcp.options import SocketOptions
+    from sttcp.router import Router
+    from sttcp.compression import Compression, CompressionError, check_framer
+
+# Amount of cancelled or timed out request IDs remembered to drop their late responses
+_ABANDONED_LIMIT = 4096
+
+
+def _default_connection(addr: tuple, connection: Union[socket.socket, Connection]) -> Union[bool, None]:
+    if isinstance(connection, Connection):
+        connection.send_message(b'ok')
+    else:
+        connection.sendall(b'ok')
     return None
 
 
 def _default_response(addr: tuple, connection: socket.socket, data: bytes):
-    print_sync(f'Received "{data.decode("utf-8")}"')
+    logger.info(f'Received "{bytes(data).decode("utf-8")}"')
     return False
 
 
+def _default_pipelined_connection(addr: tuple, connection: Connection) -> Union[bool, None]:
+    return True
+
+
+def _default_pipelined_response(addr: tuple, connection: Connection, data: bytes):
+    return True
+
+
 def _default_disconnection(addr: tuple, reason: Union[None, Exception]):
     pass
 
@@ -31,7 +68,7 @@ def _default_universal(handler_type, addr: Union[tuple, None], connection: Union
 
 
 def _default_unconnected(addr: tuple, e: Exception):
-    print_sync(f'Couldn\'t connect to {":".join(map(str, addr))}')
+    logger.warning(f'Couldn\'t connect to {format_address(addr)}')
     raise e
 
 
@@ -45,10 +82,35 @@ class Client:
         disconnection = 3
         unconnected = 4
 
-    def __init__(self, host: str, port: Union[str, int], handler=None):
+    def __init__(self, host: str, port: Union[str, int, None], handler=None, framer=None, buffer_size: int = 1024,
+                 zero_copy: bool = False, metrics: Union[bool, Metrics] = False, writer=None,
+                 idle_timeout: Union[float, None] = None, keepalive: Union[bool, KeepAlive] = False,
+                 pipelining: bool = False, transport: Union[Transport, None] = None,
+                 socket_options: Union[bool, SocketOptions] = False, router: Union[Router, None] = None,
+                 compression: Union[bool, Compression] = False):
         """
         Represents client TCP connection. Add handler using @client.add_handler decorator or server.set_handler(handler)
         function.
+        :param framer: Factory of `sttcp.framing.Framer` (like `LengthPrefixFramer`) to deliver whole messages to
+        `response_handler` instead of raw chunks. Handlers get `sttcp.connection.Connection` with `send_message` method
+        :param buffer_size: Maximum size of one received chunk
+        :param zero_copy: Receive into one preallocated buffer per connection using `recv_into`. Handlers get
+        `memoryview` slices of it instead of `bytes`, which are valid only until the handler returns
+        :param metrics: Collect `sttcp.metrics.Metrics` (pass True or an existing instance), read them with
+        `client.metrics.snapshot()`
+        :param writer: Factory of `sttcp.writer.Writer` called with the socket. `sendall` of handler connection then
+        queues data which is sent in background
+        :param idle_timeout: Close connection if it didn't receive anything for this amount of seconds.
+        `disconnection_handler` gets `sttcp.timeouts.IdleTimeoutError` as the reason
+        :param keepalive: Enable TCP keepalive, pass `sttcp.timeouts.KeepAlive` to configure probes
+        :param pipelining: Enable `client.request`, which sends many requests without waiting for responses. The server
+        must answer using `sttcp.pipeline.responder`. Uses `LengthPrefixFramer` if `framer` isn't set
+        :param transport: `sttcp.transport.TCP`, `TCP6`, `Unix` or `Loopback`. By default `Unix` if `port` is None
+        (then `host` is a socket path), `TCP6` if `host` is an IPv6 address and `TCP` otherwise
+        :param socket_options: `sttcp.options.SocketOptions` of the socket. True uses defaults (`TCP_NODELAY`)
+        :param router: `sttcp.router.Router` used as response handler, see `client.route`
+        :param compression: `sttcp.compression.Compression` of messages (True uses zlib). The server must have
+        compression enabled too. Uses `LengthPrefixFramer` if `framer` isn't set, other framers raise `ValueError`
         """
         self._connection_handler = _default_connection
         self._response_handler = _default_response
@@ -56,96 +118,302 @@ class Client:
         self._universal_handler = _default_universal
         self._unconnected_handler = _default_unconnected
 
+        if pipelining:
+            self._connection_handler = _default_pipelined_connection
+            self._response_handler = _default_pipelined_response
+
         self.handler = handler
+        self.compression = Compression() if compression is True else compression or None
+        self.framer = LengthPrefixFramer if (pipelining or self.compression is not None) and framer is None else framer
+        if self.compression is not None:
+            check_framer(self.framer)
+        self.pipelining = pipelining
+        self.buffer_size = buffer_size
+        self.zero_copy = zero_copy
+        self.metrics = Metrics() if metrics is True else metrics or None
+        self.writer = writer
+        self.idle_timeout = idle_timeout
+        self.keepalive = KeepAlive() if keepalive is True else keepalive or None
+        self.socket_options = SocketOptions() if socket_options is True else socket_options or None
+        self.router = router
+        if router is not None:
+            self._response_handler = router
         self.host = host
         self.port = port
-        self.address = str(self.host) + ':' + str(self.port)
-        self.sock_name = (self.host, self.port)
+        self.transport = transport or detect(host, port)
+        self.sock_name = self.transport.address(self.host, self.port)
+        self.address = format_address(self.sock_name)
 
         self.is_connected = False
-
-        def client():
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._connection = None
+        self._requests = {}
+        self._request_ids = itertools.count(1)
+        self._abandoned = OrderedDict()
+        self._send_lock = threading.Lock()
+
+        def run():
+            self._socket = self.transport.create_socket()
             s = self._socket
             try:
-                s.connect(self.sock_name)
+                if self.socket_options is not None:
+                    self.socket_options.apply(s, self.transport.tcp)
+                if self.keepalive is not None and self.transport.tcp:
+                    self.keepalive.apply(s)
+                self.transport.connect(s, self.sock_name)
                 self.is_connected = True
                 self.sock_name = s.getsockname()
                 addr = s.getpeername()
 
+                metrics = self.metrics
+                if self.framer is not None or metrics is not None or self.writer is not None:
+                    framer = None if self.framer is None else self.framer()
+                    connection = Connection(s, framer, metrics, None if self.writer is None else self.writer(s),
+                                            None if self.compression is None else
+                                            self.compression.session(True, framer.max_size))
+                    if connection.compression is not None:
+                        connection.negotiate()
+                else:
+                    connection = s
+                self._connection = connection
+                self._connection_event.set()
+                if metrics is not None:
+                    metrics.connection_opened()
+                buffer = memoryview(bytearray(self.buffer_size)) if self.zero_copy else None
+                watch = None if self.idle_timeout is None else IdleWatch(s, self.idle_timeout)
+                if connection is not s:
+                    connection.watch = watch
+
+                universal = None if self._universal_handler is _default_universal else self._universal_handler
+
                 disconnection_reason = None
-                data = None
-                while True:
-                    if data is None:
-                        continue_request_alt = self._universal_handler(self.HandlerType.connection, addr, s, None)
-                        continue_request = self._connection_handler(addr, s)
-                    else:
-                        if not self._socket_thread.shutdown:
-                            try:
-                                continue_request_alt = self._universal_handler(self.HandlerType.response, addr, s, data)
-                                continue_request = self._response_handler(addr, s, data)
-                            except (ConnectionResetError, ConnectionRefusedError, ConnectionAbortedError,
-                                    ConnectionError, OSError) as e:
-                                disconnection_reason = e
-                                break
-                            except Exception as e:
-                                message = ('\033[91mOh no! Something went wrong in your handler! Check it out and find '
-                                           'problems:\033[0m')
-                                message += '\n' + traceback.format_exc()
-                                message += '\n' + '\033[91mDisconnecting the client\033[0m'
-                                print_sync(message)
-                                disconnection_reason = e
-                                s.close()
+                messages = (None,)
+                running = True
+                try:
+                    while True:
+                        for data in messages:
+                            if data is not None and self.pipelining and self._resolve(data):
+                                continue
+
+                            started = time.perf_counter() if metrics is not None else 0.0
+                            if data is None:
+                                continue_request_alt = True if universal is None else \
+                                    universal(self.HandlerType.connection, addr, connection, None)
+                                continue_request = self._connection_handler(addr, connection)
+                            else:
+                                if not self._socket_thread.shutdown:
+                                    try:
+                                        continue_request_alt = True if universal is None else \
+                                            universal(self.HandlerType.response, addr, connection, data)
+                                        continue_request = self._response_handler(addr, connection, data)
+                                    except (ConnectionResetError, ConnectionRefusedError, ConnectionAbortedError,
+                                            ConnectionError, OSError) as e:
+                                        disconnection_reason = e
+                                        running = False
+                                        break
+                                    except Exception as e:
+                                        message = ('\033[91mOh no! Something went wrong in your handler! Check it out '
+                                                   'and find problems:\033[0m')
+                                        message += '\n' + traceback.format_exc()
+                                        message += '\n' + '\033[91mDisconnecting the client\033[0m'
+                                        logger.error(message)
+                                        if metrics is not None:
+                                            metrics.handled(self.HandlerType.response, time.perf_counter() - started,
+                                                            error=True)
+                                        disconnection_reason = e
+                                        connection.close()
+                                        running = False
+                                        break
+                                else:
+                                    connection.close()
+                                    disconnection_reason = self.DestructionException('Connection closed!')
+                                    running = False
+                                    break
+
+                            if self.handler is not None:
+                                self.handler(addr, connection, data)
+
+                            if continue_request is None:
+                                continue_request = continue_request_alt or True
+
+                            if metrics is not None:
+                                if data is None:
+                                    metrics.handled(self.HandlerType.connection, time.perf_counter() - started, 0)
+                                else:
+                                    metrics.handled(self.HandlerType.response, time.perf_counter() - started)
+
+                            if not continue_request:
+                                connection.close()
+                                running = False
                                 break
-                        else:
-                            s.close()
-                            disconnection_reason = self.DestructionException('Connection closed!')
-                            break
 
-                    if self.handler is not None:
-                        self.handler(addr, s, data)
+                        if not running:
+                            break
 
-                    if continue_request is None:
-                        continue_request = continue_request_alt or True
+                        try:
+                            if buffer is None:
+                                data = s.recv(self.buffer_size)
+                            else:
+                                data = buffer[:s.recv_into(buffer)]
+                        except OSError:
+                            data = b''
+
+                        if not data:
+                            if self._socket_thread.shutdown:
+                                disconnection_reason = self.DestructionException('Connection closed!')
+                            elif watch is not None and watch.expired:
+                                disconnection_reason = watch.error()
+                            elif connection is not s and connection.compression is not None:
+                                disconnection_reason = connection.compression.error
+                            break
 
-                    if not continue_request:
-                        s.close()
-                        break
+                        if watch is not None:
+                            watch.touch()
 
-                    try:
-                        data = s.recv(1024)
-                    except OSError:
-                        data = b''
+                        messages = connection.receive(data) if connection is not s else (data,)
+                except (FrameTooLargeError, CompressionError) as e:
+                    disconnection_reason = e
 
-                    if not data:
-                        break
+                if watch is not None:
+                    watch.cancel()
+                if metrics is not None:
+                    metrics.connection_closed()
+                self._fail_requests(disconnection_reason)
 
                 self._universal_handler(self.HandlerType.disconnection, addr, None, None)
                 self._disconnection_handler(addr, disconnection_reason)
 
-                print_sync(f'Stopped client {":".join(map(str, self.sock_name))}')
+                logger.info(f'Stopped client {format_address(self.sock_name)}')
             except (ConnectionResetError, ConnectionRefusedError, ConnectionAbortedError, ConnectionError, OSError) \
                     as e:
 
                 self._universal_handler(self.HandlerType.unconnected, None, None, None)
-                self._unconnected_handler((self.host, self.port), e)
+                self._unconnected_handler(self.transport.address(self.host, self.port), e)
 
-            s.close()
-            self.closed = True
-            connections.remove(self)
+        def client():
+            try:
+                run()
+            finally:
+                if hasattr(self, '_socket'):
+                    self._socket.close()
+                self._fail_requests(None)
+                self.closed = True
+                with connections_lock:
+                    connections.remove(self)
+                self._connection_event.set()
+                self._closed_event.set()
 
         self._socket_thread = threading.Thread(target=client, daemon=True)
         self._socket_thread.shutdown = False
+        self._connection_event = threading.Event()
+        self._closed_event = threading.Event()
         self.closed = False
 
     def start(self):
         """Starts TCP client"""
+        with connections_lock:
+            connections.append(self)
         self._socket_thread.start()
-        connections.append(self)
 
     def close(self):
-        """Closes TCP client"""
+        """Closes TCP client. Returns immediately, use `wait_closed` to wait until the client is stopped"""
         self._socket_thread.shutdown = True
+        if self.is_connected:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def wait_connected(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Blocks until the client is connected.
+        :return: False if timeout expired or the client couldn't connect
+        """
+        self._connection_event.wait(timeout)
+        return self.is_connected
+
+    def wait_closed(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Blocks until the client is stopped.
+        :return: False if timeout expired
+        """
+        return self._closed_event.wait(timeout)
+
+    def request(self, payload: bytes, timeout: Union[float, None] = None) -> Future:
+        """
+        Sends a request without waiting for previous responses. Requires `pipelining=True`.
+        :param payload: Request data
+        :param timeout: Seconds to wait for the response, then the future fails with
+        `sttcp.pipeline.RequestTimeoutError`. Also limits waiting for the connection
+        :return: `concurrent.futures.Future` with response bytes. Cancelling it forgets the request, its response is
+        dropped if it arrives later (as well as the response of a request which timed out)
+        """
+        if not self.pipelining:
+            raise RuntimeError('Client was created without pipelining=True')
+        if not self.wait_connected(timeout) or self.closed:
+            raise ConnectionError(f'Client is not connected to {self.address}')
+
+        correlation_id = next(self._request_ids)
+        future = Future()
+        self._requests[correlation_id] = future
+
+        timer = None
+        if timeout is not None:
+            def expire():
+                try:
+                    future.set_exception(pipeline.RequestTimeoutError(f'No response in {timeout} seconds'))
+                except InvalidStateError:
+                    pass
+            timer = wheel.schedule(timeout, expire)
+
+        def done(_):
+            if self._requests.pop(correlation_id, None) is not None:
+                # Cancelled or timed out, a late response is dropped instead of reaching `response_handler`
+                self._abandoned[correlation_id] = True
+                if len(self._abandoned) > _ABANDONED_LIMIT:
+                    self._abandoned.popitem(last=False)
+            if timer is not None:
+                timer.cancel()
+        future.add_done_callback(done)
+
+        try:
+            with self._send_lock:
+                self._connection.send_message(pipeline.pack(correlation_id, payload))
+        except OSError as e:
+            try:
+                future.set_exception(e)
+            except InvalidStateError:
+                pass
+        return future
+
+    def _resolve(self, message) -> bool:
+        try:
+            correlation_id, payload = pipeline.unpack(message)
+        except pipeline.ProtocolError:
+            return False
+        future = self._requests.pop(correlation_id, None)
+        if future is None:
+            return self._abandoned.pop(correlation_id, False)
+        try:
+            future.set_result(payload)
+        except InvalidStateError:
+            pass
+        return True
+
+    def _fail_requests(self, reason: Union[Exception, None]):
+        while self._requests:
+            try:
+                correlation_id, future = self._requests.popitem()
+            except KeyError:
+                break
+            try:
+                future.set_exception(reason or ConnectionResetError('Connection closed before response'))
+            except InvalidStateError:
+                pass
+
+    @property
+    def in_flight(self) -> int:
+        """Amount of requests waiting for a response"""
+        return len(self._requests)
 
     def stop(self):
         """Alternative of .close()"""
@@ -180,6 +448,17 @@ class Client:
         """
         self._unconnected_handler = function
 
+    def route(self, opcode: int):
+        """
+        Decorator which registers a response handler of framed messages starting with `opcode`. Handler gets
+        `"address: tuple"`, `"connection: sttcp.connection.Connection"` and `"payload: bytes"` parameters and returns
+        False to disconnect like `response_handler`. Replaces the response handler by `client.router`
+        """
+        if self.router is None:
+            self.router = Router()
+        self._response_handler = self.router
+        return self.router.route(opcode)
+
     def universal_handler(self, function) -> None:
         """
         Sets a universal handler for TCP client.
@@ -200,18 +479,14 @@ class Client:
     def keep_alive(self):
         """Use it to make client stoppable only by KeyboardInterrupt exception."""
         try:
-            while not self.is_connected:
-                pass
-
-            print_sync('Press Ctrl + C to stop client!')
+            if self.wait_connected():
+                logger.info('Press Ctrl + C to stop client!')
 
-            while self._socket_thread.is_alive():
-                self._socket_thread.join(0.1)
+            self.wait_closed()
         except KeyboardInterrupt:
             if hasattr(self, '_socket'):
 
-                print_sync('Stopping client...')
+                logger.info('Stopping client...')
 
                 self.close()
-                while not self.closed:
-                    time.sleep(0.1)
+                self.wait_closed()
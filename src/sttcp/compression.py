@@ -0,0 +1,240 @@
+import threading
+import zlib
+from typing import Union
+try:
+    from .framing import FrameTooLargeError, LengthPrefixFramer
+except ImportError:
+    from sttcp.framing import FrameTooLargeError, LengthPrefixFramer
+
+_OFFER = b'\xffsttcp-codecs\x00'
+_ANSWER = b'\xffsttcp-codec\x00'
+_RAW = b'\x00'
+_COMPRESSED = b'\x01'
+
+
+class NegotiationError(ConnectionError):
+    """Passed to `disconnection_handler` of a client when the server didn't answer its compression offer."""
+    pass
+
+
+class CompressionError(ConnectionError):
+    """Passed to `disconnection_handler` when a received message has an unknown flag or can't be decompressed."""
+    pass
+
+
+class Codec:
+    """
+    Base class of compression codecs. `name` is sent during negotiation. Compressors and decompressors are created
+    once per connection and keep their state between messages, so each of them must handle a sequence of messages.
+    """
+    name = b''
+
+    def compressor(self):
+        """Returns object with `compress(data) -> bytes` which returns the whole compressed message"""
+        raise NotImplementedError
+
+    def decompressor(self, max_size: Union[int, None] = None):
+        """
+        Returns object with `decompress(data) -> bytes`, which raises `sttcp.framing.FrameTooLargeError` when a message
+        decompresses to more than `max_size` bytes
+        """
+        raise NotImplementedError
+
+
+class _ZlibCompressor:
+    __slots__ = ('_compressor',)
+
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class _ZlibDecompressor:
+    __slots__ = ('_decompressor', '_max_size')
+
+    def __init__(self, decompressor, max_size: Union[int, None]):
+        self._decompressor = decompressor
+        self._max_size = max_size
+
+    def decompress(self, data: bytes) -> bytes:
+        if self._max_size is None:
+            return self._decompressor.decompress(data)
+        message = self._decompressor.decompress(data, self._max_size + 1)
+        if len(message) > self._max_size or self._decompressor.unconsumed_tail:
+            raise FrameTooLargeError(f'Decompressed message exceeds the limit of {self._max_size} bytes')
+        return message
+
+
+class ZlibCodec(Codec):
+    name = b'zlib'
+
+    def __init__(self, level: int = 6, window_bits: int = 15, memory_level: int = 8):
+        """
+        Raw deflate with one context per connection and direction. Messages are sync flushed, so later messages can
+        reference data of earlier ones.
+        :param level: Compression level from 1 (fast) to 9 (small)
+        :param window_bits: Size of the history window, from 9 to 15
+        :param memory_level: Memory used by the compressor, from 1 to 9
+        """
+        self.level = level
+        self.window_bits = window_bits
+        self.memory_level = memory_level
+
+    def compressor(self):
+        return _ZlibCompressor(zlib.compressobj(self.level, zlib.DEFLATED, -self.window_bits, self.memory_level))
+
+    def decompressor(self, max_size: Union[int, None] = None):
+        return _ZlibDecompressor(zlib.decompressobj(-self.window_bits), max_size)
+
+
+class Compression:
+    def __init__(self, codecs=None, threshold: int = 256, timeout: float = 5.0):
+        """
+        Per-message compression of `sttcp.server.Server` and `sttcp.client.Client` messages. Client offers its codecs
+        when it connects and the server picks the first of its own codecs the client supports. Servers also serve
+        clients without compression. Client holds its messages back until the server answers.
+        :param codecs: `Codec` instances in order of preference, `ZlibCodec()` by default
+        :param threshold: Messages shorter than this amount of bytes are sent uncompressed
+        :param timeout: Seconds the client waits for the answer, then it disconnects with `NegotiationError`
+        """
+        self.codecs = list(codecs) if codecs is not None else [ZlibCodec()]
+        self.threshold = threshold
+        self.timeout = timeout
+
+    def session(self, client: bool, max_size: Union[int, None] = None) -> 'Session':
+        """Returns compression state of one connection"""
+        return Session(self, client, max_size)
+
+
+def check_framer(framer) -> None:
+    """
+    Raises `ValueError` unless `framer` creates `LengthPrefixFramer` instances. Compressed bytes may contain a delimiter
+    or change the message size, so other framers would corrupt messages.
+    """
+    if not isinstance(framer(), LengthPrefixFramer):
+        raise ValueError('Compression needs a LengthPrefixFramer framer')
+
+
+class Session:
+    def __init__(self, config: Compression, client: bool, max_size: Union[int, None] = None):
+        """
+        Compression state of one connection. Every message has a flag byte after the negotiation. `encode` and the
+        send after it must be done holding `lock`, so compressed messages are sent in the order they were compressed.
+        Client messages encoded before the answer are queued and sent when it arrives.
+        """
+        self.config = config
+        self.client = client
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+        self.codec = None
+        self._compressor = None
+        self._decompressor = None
+        self._negotiating = True
+        self._send_flags = False
+        self._receive_flags = False
+        self._queue = []
+        self.timer = None
+        self.error = None
+
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def offer(self) -> bytes:
+        """Returns the negotiation message the client sends first"""
+        return _OFFER + b','.join(codec.name for codec in self.config.codecs)
+
+    def _use(self, codec: Union[Codec, None]):
+        self.codec = codec
+        if codec is not None:
+            self._compressor = codec.compressor()
+            self._decompressor = codec.decompressor(self.max_size)
+
+    def encode(self, payload: bytes) -> Union[bytes, None]:
+        """Returns the message to send or None if it was queued until the end of the negotiation"""
+        if self.error is not None:
+            raise self.error
+        if not self._send_flags:
+            if self.client and self._negotiating:
+                self._queue.append(payload)
+                return None
+            return payload
+        if self._compressor is None or len(payload) < self.config.threshold:
+            return _RAW + payload
+
+        compressed = self._compressor.compress(payload)
+        self.bytes_before += len(payload)
+        self.bytes_after += len(compressed)
+        return _COMPRESSED + compressed
+
+    def decode(self, message: bytes, reply) -> Union[bytes, None]:
+        """
+        Returns the original message or None for negotiation messages.
+        :param reply: Function which sends a framed message as it is. Server answers the offer with it and client sends
+        queued messages
+        """
+        if self._receive_flags:
+            flag = message[:1]
+            if flag == _RAW:
+                return message[1:]
+            if flag == _COMPRESSED and self._decompressor is not None:
+                try:
+                    return self._decompressor.decompress(message[1:])
+                except FrameTooLargeError:
+                    raise
+                except (zlib.error, ValueError) as e:
+                    raise CompressionError(f'Could not decompress message: {e}') from e
+            raise CompressionError(f'Unknown compression flag {flag!r}')
+
+        if not self._negotiating:
+            return message
+
+        if self.client:
+            if not message.startswith(_ANSWER):
+                return message
+            name = message[len(_ANSWER):]
+            if self.timer is not None:
+                self.timer.cancel()
+            with self.lock:
+                if self.error is not None:
+                    return None
+                self._use(next((codec for codec in self.config.codecs if codec.name == name), None))
+                self._negotiating = False
+                self._send_flags = True
+                queued, self._queue = self._queue, []
+                for payload in queued:
+                    reply(self.encode(payload))
+            self._receive_flags = True
+            return None
+
+        self._negotiating = False
+        if not message.startswith(_OFFER):
+            return message
+
+        offered = message[len(_OFFER):].split(b',')
+        codec = next((codec for codec in self.config.codecs if codec.name in offered), None)
+        with self.lock:
+            reply(_ANSWER + (b'' if codec is None else codec.name))
+            self._use(codec)
+            self._send_flags = True
+        self._receive_flags = True
+        return None
+
+    def expire(self) -> bool:
+        """Fails the negotiation of a client which got no answer. Returns False if it already finished"""
+        with self.lock:
+            if not self._negotiating or self.error is not None:
+                return False
+            self._queue.clear()
+            self.error = NegotiationError(f'Server did not answer the compression offer in {self.config.timeout} '
+                                          f'seconds')
+            return True
+
+    def stats(self) -> dict:
+        return {
+            'codec': None if self.codec is None else self.codec.name.decode(),
+            'bytes_before': self.bytes_before,
+            'bytes_after': self.bytes_after,
+        }
@@ -0,0 +1,199 @@
+import socket
+import time
+from typing import Iterator, Union
+try:
+    from .framing import Framer
+    from .metrics import Metrics
+    from .writer import Writer
+    from .compression import Session
+    from .timeouts import wheel
+    from . import stream
+except ImportError:
+    from sttcp.framing import Framer
+    from sttcp.metrics import Metrics
+    from sttcp.writer import Writer
+    from sttcp.compression import Session
+    from sttcp.timeouts import wheel
+    from sttcp import stream
+
+
+class Connection:
+    def __init__(self, sock: socket.socket, framer: Framer = None, metrics: Metrics = None, writer: Writer = None,
+                 compression: Session = None):
+        """
+        Socket wrapper passed to handlers when connection has extra per-connection state like a framer, metrics,
+        a buffered writer or compression. Every `socket.socket` attribute is available on it.
+        `watch` is the `sttcp.timeouts.IdleWatch` of the connection, set by the server or the client which owns it.
+        """
+        self.socket = sock
+        self.framer = framer
+        self.metrics = metrics
+        self.writer = writer
+        self.compression = compression
+        self.watch = None
+
+        self.connected_at = time.time()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.recv_calls = 0
+
+    def _sent(self, size: int) -> None:
+        self.bytes_out += size
+        if self.metrics is not None:
+            self.metrics.sent(size)
+
+    def _received(self, size: int) -> None:
+        self.bytes_in += size
+        if self.metrics is not None:
+            self.metrics.received(size)
+
+    def sendall(self, data: bytes) -> None:
+        if self.writer is None:
+            self.socket.sendall(data)
+        else:
+            self.writer.write(data)
+        self._sent(len(data))
+
+    def send(self, data: bytes, *args) -> int:
+        if self.writer is None:
+            size = self.socket.send(data, *args)
+        else:
+            self.writer.write(data)
+            size = len(data)
+        self._sent(size)
+        return size
+
+    def send_message(self, payload: bytes) -> None:
+        """Sends `payload` as one message using connection framer"""
+        if self.compression is not None:
+            with self.compression.lock:
+                payload = self.compression.encode(payload)
+                if payload is not None:
+                    self._send_frame(payload)
+            return
+        self._send_frame(payload)
+
+    def negotiate(self) -> None:
+        """
+        Sends the compression offer. Client calls it before sending anything else. The connection is shut down if
+        the server doesn't answer in time
+        """
+        with self.compression.lock:
+            self._send_frame(self.compression.offer())
+        self.compression.timer = wheel.schedule(self.compression.config.timeout, self._negotiation_expired)
+
+    def _negotiation_expired(self) -> None:
+        if self.compression.expire():
+            try:
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _send_frame(self, payload: bytes) -> None:
+        if self.framer is not None:
+            payload = self.framer.frame(payload)
+        self.sendall(payload)
+
+    def receive(self, data: bytes):
+        """
+        Returns messages completed by received `data` chunk. With a framer they are extracted one by one while
+        iterating, so a handler can take the data after its message as a raw stream with `receive_stream`.
+        """
+        self.recv_calls += 1
+        self._received(len(data))
+
+        if self.framer is None:
+            return [data]
+        self.framer.append(data)
+        if self.compression is not None:
+            return self._decompressed()
+        return iter(self.framer.next, None)
+
+    def _decompressed(self):
+        while True:
+            message = self.framer.next()
+            if message is None:
+                return
+            message = self.compression.decode(message, self._send_frame)
+            if message is not None:
+                yield message
+
+    def send_file(self, file, offset: int = 0, count: Union[int, None] = None) -> int:
+        """
+        Sends a file opened in binary mode with `os.sendfile`, without reading it into memory. The data isn't framed,
+        send its size in a message first and receive it with `receive_stream` or `receive_to_file`.
+        Buffered writes are sent before it, other threads must not write to the connection meanwhile.
+        :return: Amount of sent bytes
+        """
+        self.flush()
+        sent = stream.send_file(self.socket, file, offset, count)
+        self._sent(sent)
+        return sent
+
+    def send_stream(self, data, chunk_size: int = stream.CHUNK_SIZE) -> int:
+        """
+        Sends a large buffer in `memoryview` slices, or every chunk of an iterable, without framing.
+        :return: Amount of sent bytes
+        """
+        self.flush()
+        sent = stream.send_stream(self.socket, data, chunk_size)
+        self._sent(sent)
+        return sent
+
+    def receive_stream(self, size: int, chunk_size: int = stream.CHUNK_SIZE) -> Iterator[memoryview]:
+        """
+        Receives exactly `size` raw bytes following the current message as chunks. Call it from a handler. Chunks are
+        valid only until the next one is requested.
+        """
+        initial = b'' if self.framer is None else self.framer.read(size)
+        for chunk in stream.iter_recv(self.socket, size, chunk_size, initial):
+            if chunk.obj is not initial:
+                self._received(len(chunk))
+                if self.watch is not None:
+                    self.watch.touch()
+            yield chunk
+
+    def receive_to_file(self, file, size: int, chunk_size: int = stream.CHUNK_SIZE) -> int:
+        """
+        Receives exactly `size` raw bytes following the current message into a file opened in binary mode.
+        :return: Amount of received bytes
+        """
+        received = 0
+        for chunk in self.receive_stream(size, chunk_size):
+            file.write(chunk)
+            received += len(chunk)
+        return received
+
+    def stats(self) -> dict:
+        """Returns per-connection counters"""
+        return {
+            'connected_at': self.connected_at,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'recv_calls': self.recv_calls,
+            'compression': None if self.compression is None else self.compression.stats(),
+        }
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until buffered writes are sent. Returns False if timeout expired or sending failed"""
+        if self.writer is None:
+            return True
+        return self.writer.flush(timeout)
+
+    def close(self) -> None:
+        """Sends buffered writes and closes the socket"""
+        if self.writer is not None:
+            self.writer.close()
+        self.socket.close()
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f'<sttcp.connection.Connection {self.socket!r}>'
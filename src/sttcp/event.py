@@ -0,0 +1,375 @@
+import asyncio
+import inspect
+import os
+import socket
+import threading
+import traceback
+from typing import Union
+try:
+    from . import connections, connections_lock, logger
+    from .server import Server, _default_connection, _default_receive, _default_disconnection, _default_universal
+    from .framing import Framer, FrameTooLargeError
+    from .timeouts import IdleTimeoutError, KeepAlive
+    from .transport import Transport, detect, format_address
+    from .options import SocketOptions
+except ImportError:
+    from sttcp import connections, connections_lock, logger
+    from sttcp.server import Server, _default_connection, _default_receive, _default_disconnection, _default_universal
+    from sttcp.framing import Framer, FrameTooLargeError
+    from sttcp.timeouts import IdleTimeoutError, KeepAlive
+    from sttcp.transport import Transport, detect, format_address
+    from sttcp.options import SocketOptions
+
+
+class _Activity:
+    __slots__ = ('last', 'expired', 'reading')
+
+    def __init__(self, last: float):
+        self.last = last
+        self.expired = False
+        self.reading = False
+
+
+async def _call(function, *args):
+    result = function(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+class EventConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, framer: Framer = None):
+        """
+        Socket-like connection object passed to `EventServer` handlers. Writes never block the event loop: data is
+        buffered by the transport, use `await connection.drain()` to wait until it is flushed.
+        """
+        self.reader = reader
+        self.writer = writer
+        self.framer = framer
+        self.socket = writer.get_extra_info('socket')
+
+    def send_message(self, payload: bytes) -> None:
+        """Sends `payload` as one message using connection framer"""
+        if self.framer is not None:
+            payload = self.framer.frame(payload)
+        self.writer.write(payload)
+
+    def receive(self, data: bytes) -> list:
+        """Returns messages completed by received `data` chunk"""
+        if self.framer is None:
+            return [data]
+        return self.framer.feed(data)
+
+    def sendall(self, data: bytes) -> None:
+        self.writer.write(data)
+
+    def send(self, data: bytes) -> int:
+        self.writer.write(data)
+        return len(data)
+
+    async def drain(self) -> None:
+        """Waits until the transport write buffer is below its high watermark"""
+        await self.writer.drain()
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def getpeername(self):
+        return self.writer.get_extra_info('peername')
+
+    def getsockname(self):
+        return self.writer.get_extra_info('sockname')
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class EventServer:
+    HandlerType = Server.HandlerType
+
+    def __init__(self, host: str, port: Union[str, int, None], handler=None, framer=None, buffer_size: int = 1024,
+                 idle_timeout: Union[float, None] = None, keepalive: Union[bool, KeepAlive] = False,
+                 transport: Union[Transport, None] = None, socket_options: Union[bool, SocketOptions] = False):
+        """
+        Represents server TCP connection which multiplexes every client on one asyncio event loop thread instead of
+        starting a thread per client. Handlers are the same as for `sttcp.server.Server` and may also be coroutine
+        functions, which are awaited. Handlers get `sttcp.event.EventConnection` instead of `socket.socket`.
+        Synchronous handlers run on the event loop thread, so they should not block.
+        :param framer: Factory of `sttcp.framing.Framer` to deliver whole messages to `receive_handler`
+        :param buffer_size: Maximum size of one received chunk
+        :param idle_timeout: Close connections which didn't receive anything for this amount of seconds.
+        `disconnection_handler` gets `sttcp.timeouts.IdleTimeoutError` as the reason. One periodic check on the event
+        loop serves every connection, with at most half a second of delay
+        :param keepalive: Enable TCP keepalive, pass `sttcp.timeouts.KeepAlive` to configure probes
+        :param transport: `sttcp.transport.TCP`, `TCP6` or `Unix`. By default `Unix` if `port` is None (then `host` is
+        a socket path), `TCP6` if `host` is an IPv6 address and `TCP` otherwise
+        :param socket_options: `sttcp.options.SocketOptions` of listening and accepted sockets. True uses defaults:
+        `TCP_NODELAY`, `SO_REUSEADDR` and `SOMAXCONN` backlog
+        """
+        self._connection_handler = _default_connection
+        self._receive_handler = _default_receive
+        self._disconnection_handler = _default_disconnection
+        self._universal_handler = _default_universal
+
+        self.handler = handler
+        self.framer = framer
+        self.buffer_size = buffer_size
+        self.idle_timeout = idle_timeout
+        self.keepalive = KeepAlive() if keepalive is True else keepalive or None
+        self.socket_options = SocketOptions() if socket_options is True else socket_options or None
+        self.host = host
+        self.port = port
+        self.transport = transport or detect(host, port)
+        self.sock_name = self.transport.address(self.host, self.port)
+        self.address = format_address(self.sock_name)
+
+        self.is_listening = False
+
+        self._loop = asyncio.new_event_loop()
+        self._stop = None
+        self._clients = set()
+        self._activity = {}
+        self._sweeper = None
+        self._bound = False
+
+        self._socket_thread = threading.Thread(target=self._run, daemon=True)
+        self._socket_thread.shutdown = False
+        self._listening_event = threading.Event()
+        self._closed_event = threading.Event()
+        self.closed = False
+
+    async def _conn_handler(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        conn = EventConnection(reader, writer, None if self.framer is None else self.framer())
+        addr = self.transport.peer_address(conn.socket, conn.getpeername())
+        if self.socket_options is not None:
+            self.socket_options.apply(conn.socket, self.transport.tcp)
+        if self.keepalive is not None and self.transport.tcp:
+            self.keepalive.apply(conn.socket)
+
+        try:
+            connect_alt = await _call(self._universal_handler, self.HandlerType.connection, addr, None, None)
+            connect = await _call(self._connection_handler, addr, conn)
+        except (ConnectionResetError, ConnectionRefusedError, ConnectionAbortedError, ConnectionError, OSError):
+            writer.close()
+            return
+
+        if connect is None:
+            connect = connect_alt or True
+
+        if not connect or self._socket_thread.shutdown:
+            writer.close()
+            return
+
+        self._clients.add(writer)
+        activity = None
+        if self.idle_timeout is not None:
+            activity = self._activity[writer] = _Activity(self._loop.time())
+        disconnection_reason = None
+        while True:
+            if activity is not None:
+                activity.last = self._loop.time()
+                activity.reading = True
+            try:
+                data = await reader.read(self.buffer_size)
+            except OSError:
+                data = b''
+            if activity is not None:
+                activity.reading = False
+
+            if not data:
+                if activity is not None and activity.expired:
+                    disconnection_reason = IdleTimeoutError(f'Nothing was received for {self.idle_timeout} seconds')
+                elif self._socket_thread.shutdown:
+                    disconnection_reason = ConnectionAbortedError('Server closed')
+                break
+
+            try:
+                messages = conn.receive(data)
+            except FrameTooLargeError as e:
+                disconnection_reason = e
+                break
+
+            try:
+                for data in messages:
+                    await _call(self._universal_handler, self.HandlerType.receive, addr, conn, data)
+                    await _call(self._receive_handler, addr, conn, data)
+                    if self.handler is not None:
+                        await _call(self.handler, addr, conn, data)
+            except (ConnectionResetError, ConnectionRefusedError, ConnectionAbortedError,
+                    ConnectionError, OSError) as e:
+                disconnection_reason = e
+                break
+            except Exception as e:
+                message = ('\033[91mOh no! Something went wrong in your handler! Check it out and find '
+                           'problems:\033[0m')
+                message += '\n' + traceback.format_exc()
+                message += '\n' + '\033[91mDisconnecting the client\033[0m'
+                logger.error(message)
+                disconnection_reason = e
+                break
+
+        self._clients.discard(writer)
+        self._activity.pop(writer, None)
+        writer.close()
+
+        try:
+            await _call(self._universal_handler, self.HandlerType.disconnection, addr, None, None)
+            await _call(self._disconnection_handler, addr, disconnection_reason)
+        except Exception:
+            message = ('\033[91mOh no! Something went wrong in your handler! Check it out and find '
+                       'problems:\033[0m')
+            message += '\n' + traceback.format_exc()
+            logger.error(message)
+
+    def _sweep(self):
+        """Aborts connections waiting for data longer than `idle_timeout`. One periodic call serves every connection"""
+        now = self._loop.time()
+        for writer, activity in list(self._activity.items()):
+            if activity.reading and not activity.expired and now - activity.last >= self.idle_timeout:
+                activity.expired = True
+                writer.transport.abort()
+        self._sweeper = self._loop.call_later(min(self.idle_timeout / 2, 0.5), self._sweep)
+
+    async def _serve(self):
+        self._stop = asyncio.Event()
+        if self._socket_thread.shutdown:
+            self._stop.set()
+        sock = self.transport.create_socket()
+        try:
+            if self.socket_options is not None:
+                self.socket_options.apply_listening(sock, self.transport.tcp)
+            elif self.transport.tcp and os.name == 'posix':
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.transport.bind(sock, self.sock_name)
+        except OSError:
+            sock.close()
+            raise
+        self._bound = True
+        backlog = 100 if self.socket_options is None or self.socket_options.backlog is None \
+            else self.socket_options.backlog
+        if self.transport.tcp:
+            server = await asyncio.start_server(self._conn_handler, sock=sock, backlog=backlog)
+        else:
+            server = await asyncio.start_unix_server(self._conn_handler, sock=sock, backlog=backlog)
+        self._socket = server.sockets[0]
+        self.sock_name = self._socket.getsockname()
+
+        logger.info(f'Listening to {format_address(self.sock_name)}')
+
+        self.is_listening = True
+        self._listening_event.set()
+        if self.idle_timeout is not None:
+            self._sweeper = self._loop.call_later(min(self.idle_timeout / 2, 0.5), self._sweep)
+        async with server:
+            await self._stop.wait()
+            if self._sweeper is not None:
+                self._sweeper.cancel()
+            server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await server.wait_closed()
+
+            pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._serve())
+
+            logger.info(f'Stopped server {format_address(self.sock_name)}')
+        finally:
+            self._loop.close()
+            if self._bound:
+                self.transport.cleanup(self.sock_name)
+            self.closed = True
+            with connections_lock:
+                connections.remove(self)
+            self._listening_event.set()
+            self._closed_event.set()
+
+    def start(self):
+        """Starts TCP server"""
+        with connections_lock:
+            connections.append(self)
+        self._socket_thread.start()
+
+    def close(self):
+        """Closes TCP server and every client connection. Use `wait_closed` to wait until the server is stopped"""
+        self._socket_thread.shutdown = True
+        if self._stop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._stop.set)
+            except RuntimeError:
+                pass
+
+    def wait_listening(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Blocks until the server is listening.
+        :return: False if timeout expired or the server couldn't start listening
+        """
+        self._listening_event.wait(timeout)
+        return self.is_listening
+
+    def wait_closed(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Blocks until the server is stopped.
+        :return: False if timeout expired
+        """
+        return self._closed_event.wait(timeout)
+
+    def stop(self):
+        """Alternative of .close()"""
+        self.close()
+
+    def connection_handler(self, function) -> None:
+        """
+        Sets a connection handler for TCP server.
+        :param function: Function or coroutine function handler parameter with `"address: tuple"`,
+        `"connection: sttcp.event.EventConnection"` parameters`
+        """
+        self._connection_handler = function
+
+    def receive_handler(self, function) -> None:
+        """
+        Sets a reception handler for TCP server.
+        :param function: Function or coroutine function handler parameter with `"address: tuple"`,
+        `"connection: sttcp.event.EventConnection"`, `"data: bytes"` parameters`
+        """
+        self._receive_handler = function
+
+    def disconnection_handler(self, function) -> None:
+        """
+        Sets a disconnection handler for TCP server.
+        :param function: Function or coroutine function handler parameter with `"address: tuple"` parameter`
+        """
+        self._disconnection_handler = function
+
+    def universal_handler(self, function) -> None:
+        """
+        Sets a universal handler for TCP server.
+        :param function: Function or coroutine function handler parameter with
+        `"handler_type: sttcp.server.Server.HandlerType"`, `"address: tuple"`,
+        `"connection: Union[sttcp.event.EventConnection, None]"`, `"data: Union[bytes, None]"` parameters`
+        """
+        self._universal_handler = function
+
+    def keep_alive(self):
+        """Use it to make server stoppable only by KeyboardInterrupt exception."""
+        try:
+            if self.wait_listening():
+                logger.info('Press Ctrl + C to stop server!')
+
+            self.wait_closed()
+        except KeyboardInterrupt:
+            logger.info('Stopping server...')
+
+            self.close()
+            self.wait_closed()
@@ -0,0 +1,159 @@
+import struct
+from typing import List, Union
+
+
+class FrameTooLargeError(ValueError):
+    """Raised when a received frame is bigger than the framer `max_size`."""
+    pass
+
+
+class Framer:
+    def __init__(self, max_size: Union[int, None] = None):
+        """
+        Base class of message framers. Framer reassembles whole messages from received chunks using one growable
+        buffer. Consumed bytes are dropped only when they take more than a half of the buffer, so every received
+        byte is moved a constant amount of times.
+        :param max_size: Maximum message size, bigger messages raise `FrameTooLargeError`
+        """
+        self.max_size = max_size
+        self._buffer = bytearray()
+        self._offset = 0
+
+    @property
+    def pending(self) -> int:
+        """Amount of buffered bytes which are not a whole message yet"""
+        return len(self._buffer) - self._offset
+
+    def reset(self) -> None:
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def feed(self, data: Union[bytes, bytearray, memoryview]) -> List[bytes]:
+        """
+        Adds received chunk to the buffer.
+        :return: List of whole messages completed by this chunk
+        """
+        self._buffer += data
+        return list(iter(self.next, None))
+
+    def append(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        """Adds received chunk to the buffer without extracting messages, use `next` to get them one by one"""
+        self._buffer += data
+
+    def next(self) -> Union[bytes, None]:
+        """Returns the next whole buffered message or None"""
+        message = self._extract()
+        if message is None and self._offset and self._offset * 2 >= len(self._buffer):
+            self._compact()
+        return message
+
+    def read(self, size: int) -> bytes:
+        """Takes up to `size` buffered bytes as they are, without framing. Used to receive raw streams"""
+        end = min(len(self._buffer), self._offset + size)
+        data = bytes(self._buffer[self._offset:end])
+        self._offset = end
+        if self._offset * 2 >= len(self._buffer):
+            self._compact()
+        return data
+
+    def _compact(self) -> None:
+        del self._buffer[:self._offset]
+        self._offset = 0
+
+    def _take(self, start: int, end: int, consumed: int) -> bytes:
+        message = bytes(self._buffer[start:end])
+        self._offset = consumed
+        return message
+
+    def _check_size(self, size: int) -> None:
+        if self.max_size is not None and size > self.max_size:
+            raise FrameTooLargeError(f'Frame of {size} bytes exceeds the limit of {self.max_size} bytes')
+
+    def _extract(self) -> Union[bytes, None]:
+        raise NotImplementedError
+
+    def frame(self, payload: bytes) -> bytes:
+        """Returns `payload` encoded as one message"""
+        raise NotImplementedError
+
+
+class LengthPrefixFramer(Framer):
+    def __init__(self, header: Union[str, struct.Struct] = '!I', max_size: Union[int, None] = None):
+        """
+        Messages are prefixed by their length.
+        :param header: `struct` format (or `struct.Struct`) of the length header, network order unsigned int by default
+        """
+        super().__init__(max_size)
+        self.header = header if isinstance(header, struct.Struct) else struct.Struct(header)
+
+    def _extract(self):
+        start = self._offset + self.header.size
+        if len(self._buffer) < start:
+            return None
+        size, = self.header.unpack_from(self._buffer, self._offset)
+        self._check_size(size)
+        end = start + size
+        if len(self._buffer) < end:
+            return None
+        return self._take(start, end, end)
+
+    def frame(self, payload: bytes) -> bytes:
+        self._check_size(len(payload))
+        return self.header.pack(len(payload)) + payload
+
+
+class DelimiterFramer(Framer):
+    def __init__(self, delimiter: bytes = b'\n', max_size: Union[int, None] = None):
+        """
+        Messages are separated by `delimiter`, which is not included to received messages.
+        """
+        if not delimiter:
+            raise ValueError('delimiter must not be empty')
+        super().__init__(max_size)
+        self.delimiter = bytes(delimiter)
+        self._scanned = 0
+
+    def reset(self) -> None:
+        super().reset()
+        self._scanned = 0
+
+    def _compact(self) -> None:
+        self._scanned -= self._offset
+        super()._compact()
+
+    def _extract(self):
+        index = self._buffer.find(self.delimiter, max(self._offset, self._scanned))
+        if index < 0:
+            self._scanned = max(self._offset, len(self._buffer) - len(self.delimiter) + 1)
+            self._check_size(len(self._buffer) - self._offset)
+            return None
+        self._check_size(index - self._offset)
+        self._scanned = index + len(self.delimiter)
+        return self._take(self._offset, index, self._scanned)
+
+    def frame(self, payload: bytes) -> bytes:
+        if self.delimiter in payload:
+            raise ValueError('Payload contains the delimiter')
+        return payload + self.delimiter
+
+
+class FixedSizeFramer(Framer):
+    def __init__(self, size: int):
+        """
+        Every message is exactly `size` bytes long.
+        """
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        super().__init__(size)
+        self.size = size
+
+    def _extract(self):
+        end = self._offset + self.size
+        if len(self._buffer) < end:
+            return None
+        return self._take(self._offset, end, end)
+
+    def frame(self, payload: bytes) -> bytes:
+        if len(payload) != self.size:
+            raise ValueError(f'Payload must be exactly {self.size} bytes long')
+        return payload
@@ -1,59 +1,41 @@
-import threading
-
 try:
-    from ..sttcp import connections, print_sync
+    from ..sttcp import connections, connections_lock, logger
     from .client import Client
     from .server import Server
-    import time
+    from .event import EventServer
+    from .process import ProcessServer
+    from .transport import format_address
 except ImportError:
-    from sttcp import connections, print_sync
+    from sttcp import connections, connections_lock, logger
     from sttcp.client import Client
     from sttcp.server import Server
+    from sttcp.event import EventServer
+    from sttcp.process import ProcessServer
+    from sttcp.transport import format_address
 
 
 def keep_alive():
     """Use it to make all simple-threaded-tcp connections stoppable only by KeyboardInterrupt"""
     try:
-        while True:
-            i = 0
-            for self in connections:
-                if self._socket_thread.is_alive():
-                    self._socket_thread.join(0.1)
-                else:
-                    i += 1
-            if i >= len(connections):
-                break
+        while connections:
+            with connections_lock:
+                running = list(connections)
+            for self in running:
+                self.wait_closed()
     except KeyboardInterrupt:
-        for self in connections:
+        with connections_lock:
+            stopping = list(connections)
+        for self in stopping:
             if hasattr(self, '_socket'):
                 _type = 'connection'
-                if type(self) is Server:
+                if type(self) in (Server, EventServer, ProcessServer):
                     _type = 'server'
                 elif type(self) is Client:
                     _type = 'client'
 
-                print_sync(f'Stopping {_type} {":".join(map(str, self.sock_name))}...')
-
-                def close_connection():
-                    self.close()
-                    while not self.closed:
-                        time.sleep(0.1)
+                logger.info(f'Stopping {_type} {format_address(self.sock_name)}...')
 
-                threading.Thread(target=close_connection, daemon=False).start()
+            self.close()
 
-    # try:
-    #     while not self.is_listening:
-    #         pass
-    #
-    #     print_sync('Press Ctrl + C to stop server!')
-    #
-    #     while self._socket_thread.is_alive():
-    #         self._socket_thread.join(0.1)
-    # except KeyboardInterrupt:
-    #     if hasattr(self, '_socket'):
-    #
-    #         print_sync('Stopping server...')
-    #
-    #         self.close()
-    #         while not self.closed:
-    #             time.sleep(0.1)
+        for self in stopping:
+            self.wait_closed()
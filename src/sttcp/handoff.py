@@ -0,0 +1,93 @@
+import array
+import os
+import socket
+import subprocess
+import sys
+from typing import Union
+try:
+    from .transport import Unix
+except ImportError:
+    from sttcp.transport import Unix
+
+ENVIRONMENT_VARIABLE = 'STTCP_LISTEN_FD'
+
+
+def _sendmsg_fds(sock: socket.socket, buffers: list, fds: list) -> int:
+    """`socket.send_fds`, which was added in Python 3.9"""
+    return sock.sendmsg(buffers, [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))])
+
+
+def _recvmsg_fds(sock: socket.socket, size: int, max_fds: int):
+    """`socket.recv_fds`, which was added in Python 3.9"""
+    fds = array.array('i')
+    message, ancillary, flags, address = sock.recvmsg(size, socket.CMSG_LEN(max_fds * fds.itemsize))
+    for level, kind, data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    return message, list(fds), flags, address
+
+
+_send_fds = getattr(socket, 'send_fds', _sendmsg_fds)
+_recv_fds = getattr(socket, 'recv_fds', _recvmsg_fds)
+
+
+def send_socket(sock: socket.socket, path: str, timeout: Union[float, None] = 10.0) -> None:
+    """
+    Sends a listening socket to a successor process waiting in `receive_socket` (`SCM_RIGHTS` over a unix socket).
+    Returns when the successor got it. Both processes can accept connections on it until the sender closes its copy.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as channel:
+        channel.settimeout(timeout)
+        channel.connect(Unix().address(path))
+        _send_fds(channel, [b'sttcp'], [sock.fileno()])
+        if not channel.recv(1):
+            raise ConnectionError('Successor closed the handoff channel without receiving the socket')
+
+
+def receive_socket(path: str, timeout: Union[float, None] = None) -> socket.socket:
+    """
+    Waits for a listening socket sent by `send_socket` (or `sttcp.server.Server.handoff`) of the running process.
+    Pass it to the new server as `Server(host, port, sock=...)`.
+    """
+    transport = Unix()
+    address = transport.address(path)
+    with transport.create_socket() as listener:
+        transport.bind(listener, address)
+        try:
+            listener.listen(1)
+            listener.settimeout(timeout)
+            channel, _ = listener.accept()
+            with channel:
+                channel.settimeout(timeout)
+                message, fds, flags, _ = _recv_fds(channel, 16, 1)
+                if not fds:
+                    raise ConnectionError('No socket was received')
+                sock = socket.socket(fileno=fds[0])
+                channel.sendall(b'\1')
+        finally:
+            transport.cleanup(address)
+    return sock
+
+
+def inherited_socket(variable: str = ENVIRONMENT_VARIABLE) -> Union[socket.socket, None]:
+    """
+    Returns listening socket passed by `spawn_successor` (or `sttcp.server.Server.spawn_successor`) of the parent
+    process, or None when the process was started normally.
+    """
+    fd = os.environ.pop(variable, None)
+    if fd is None:
+        return None
+    return socket.socket(fileno=int(fd))
+
+
+def spawn_successor(sock: socket.socket, args: Union[list, None] = None, variable: str = ENVIRONMENT_VARIABLE,
+                    **popen) -> subprocess.Popen:
+    """
+    Starts a successor process which inherits the listening socket. It finds it with `inherited_socket`.
+    :param args: Command line, the current one (`sys.executable` and `sys.argv`) by default
+    :param popen: Other `subprocess.Popen` parameters
+    """
+    fd = sock.fileno()
+    env = dict(popen.pop('env', None) or os.environ)
+    env[variable] = str(fd)
+    return subprocess.Popen(args or [sys.executable] + sys.argv, pass_fds=(fd,), env=env, **popen)
@@ -0,0 +1,127 @@
+import atexit
+import os
+import queue
+import sys
+import threading
+from typing import Union
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+
+class Logger:
+    def __init__(self, stream=None, level: int = INFO, queue_size: int = 10000, batch_size: int = 256,
+                 lock: Union[threading.Semaphore, threading.Lock, None] = None):
+        """
+        Non-blocking logger. Messages are put to a bounded queue and written by a background thread in batches, so
+        connection threads never wait for console I/O. When the queue is full new messages are dropped and counted in
+        `dropped`.
+        :param stream: Output stream, `sys.stdout` by default
+        :param level: Minimal level of written messages
+        :param queue_size: Maximum amount of messages waiting to be written
+        :param batch_size: Maximum amount of messages written at once
+        :param lock: Lock held while writing, `sttcp.screen_lock` for the default logger
+        """
+        self.stream = stream
+        self.level = level
+        self.batch_size = batch_size
+        self.dropped = 0
+
+        self._lock = lock
+        self._queue = queue.Queue(queue_size)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def log(self, level: int, *args, sep: str = ' ', end: str = '\n') -> None:
+        """Puts message to the queue. Arguments are the same as `print` ones"""
+        if level < self.level:
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(sep.join(map(str, args)) + end)
+        except queue.Full:
+            self.dropped += 1
+
+    def debug(self, *args, **kwargs) -> None:
+        self.log(DEBUG, *args, **kwargs)
+
+    def info(self, *args, **kwargs) -> None:
+        self.log(INFO, *args, **kwargs)
+
+    def warning(self, *args, **kwargs) -> None:
+        self.log(WARNING, *args, **kwargs)
+
+    def error(self, *args, **kwargs) -> None:
+        self.log(ERROR, *args, **kwargs)
+
+    def flush(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Blocks until every queued message is written.
+        :return: False if timeout expired
+        """
+        if self._thread is None:
+            return True
+        written = threading.Event()
+        try:
+            self._queue.put(written, timeout=timeout)
+        except queue.Full:
+            return False
+        return written.wait(timeout)
+
+    def _reset(self):
+        self._queue = queue.Queue(self._queue.maxsize)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _start(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._drain, name='sttcp-logger', daemon=True)
+                self._thread.start()
+
+    def _drain(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            events = [item for item in batch if isinstance(item, threading.Event)]
+            self._write(''.join(item for item in batch if isinstance(item, str)))
+            for event in events:
+                event.set()
+
+    def _write(self, text: str):
+        if not text:
+            return
+        stream = self.stream or sys.stdout
+        if stream is None:
+            return
+        if self._lock is not None:
+            self._lock.acquire()
+        try:
+            stream.write(text)
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+        finally:
+            if self._lock is not None:
+                self._lock.release()
+
+
+def _flush_at_exit(logger: Logger):
+    logger.flush(1)
+
+
+def create_logger(**kwargs) -> Logger:
+    """Creates `Logger` which writes queued messages before interpreter exit and keeps working in forked processes"""
+    logger = Logger(**kwargs)
+    atexit.register(_flush_at_exit, logger)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=logger._reset)
+    return logger
@@ -0,0 +1,140 @@
+import bisect
+import threading
+import time
+from typing import Union
+
+
+class Histogram:
+    def __init__(self, bounds: Union[list, None] = None):
+        """
+        Histogram with fixed buckets. Default buckets are powers of two from 1 microsecond to ~17 seconds.
+        Not thread safe by itself, `Metrics` calls it under its lock.
+        """
+        self.bounds = list(bounds) if bounds is not None else [0.000001 * 2 ** i for i in range(25)]
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Returns upper bound of the bucket containing `q` quantile"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': {format(bound, 'g'): count
+                        for bound, count in zip(self.bounds + [float('inf')], self.counts) if count},
+        }
+
+
+class Metrics:
+    COUNTERS = ('active_connections', 'accepted', 'rejected', 'closed', 'bytes_in', 'bytes_out', 'recv_calls',
+                'messages', 'handler_errors')
+
+    def __init__(self):
+        """
+        Counters and handler latency histograms of a server or client. Every update takes one short lock, so it is
+        fine to keep metrics enabled in production. Use `snapshot()` to read them or `add_exporter` to push them.
+        """
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+        self._handlers = {}
+        self._exporters = []
+        self._exporting = None
+        self.started = time.time()
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def connection_opened(self) -> None:
+        with self._lock:
+            self._counters['accepted'] += 1
+            self._counters['active_connections'] += 1
+
+    def connection_closed(self) -> None:
+        with self._lock:
+            self._counters['closed'] += 1
+            self._counters['active_connections'] -= 1
+
+    def received(self, size: int) -> None:
+        with self._lock:
+            self._counters['recv_calls'] += 1
+            self._counters['bytes_in'] += size
+
+    def sent(self, size: int) -> None:
+        with self._lock:
+            self._counters['bytes_out'] += size
+
+    def handled(self, handler_type, seconds: float, messages: int = 1, error: bool = False) -> None:
+        """Records handler execution time of `handler_type` (HandlerType or str)"""
+        name = getattr(handler_type, 'name', handler_type)
+        with self._lock:
+            histogram = self._handlers.get(name)
+            if histogram is None:
+                histogram = self._handlers[name] = Histogram()
+            histogram.observe(seconds)
+            self._counters['messages'] += messages
+            if error:
+                self._counters['handler_errors'] += 1
+
+    def snapshot(self) -> dict:
+        """Returns copy of every counter and histogram"""
+        with self._lock:
+            result = dict(self._counters)
+            result['uptime'] = time.time() - self.started
+            result['handlers'] = {name: histogram.snapshot() for name, histogram in self._handlers.items()}
+        return result
+
+    def add_exporter(self, function) -> None:
+        """
+        Adds exporter called by `export()`.
+        :param function: Function with `"snapshot: dict"` parameter
+        """
+        self._exporters.append(function)
+
+    def export(self) -> dict:
+        """Passes a snapshot to every exporter"""
+        snapshot = self.snapshot()
+        for exporter in self._exporters:
+            exporter(snapshot)
+        return snapshot
+
+    def start_exporting(self, interval: float = 10.0) -> None:
+        """Calls `export()` every `interval` seconds in a background thread"""
+        if self._exporting is not None:
+            return
+        stop = self._exporting = threading.Event()
+
+        def exporting():
+            while not stop.wait(interval):
+                self.export()
+
+        threading.Thread(target=exporting, name='sttcp-metrics', daemon=True).start()
+
+    def stop_exporting(self) -> None:
+        if self._exporting is not None:
+            self._exporting.set()
+            self._exporting = None
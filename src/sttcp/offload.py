@@ -0,0 +1,152 @@
+import socket
+import threading
+import traceback
+import weakref
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+from typing import Union
+try:
+    from . import logger
+except ImportError:
+    from sttcp import logger
+
+
+class Policy(Enum):
+    inline = 1
+    thread = 2
+    process = 3
+
+
+_SENDER_IDLE = 1.0
+
+
+class _Pending:
+    __slots__ = ('futures', 'lock', 'space', 'sender')
+
+    def __init__(self, max_pending: int):
+        self.futures = deque()
+        self.lock = threading.Condition()
+        self.space = threading.BoundedSemaphore(max_pending)
+        self.sender = None
+
+
+class Offload:
+    def __init__(self, function, policy: Policy = Policy.thread, executor: Union[Executor, None] = None,
+                 max_workers: Union[int, None] = None, max_pending: int = 64):
+        """
+        Receive (or response) handler which runs `function(data) -> Union[bytes, None]` on an executor instead of the
+        connection thread and sends returned bytes back (with `send_message` if the connection has a framer).
+        Responses of one connection are sent in the order messages were received by a sender thread of the connection,
+        so a slow reader blocks neither the executor nor other connections.
+        Use it as `server.receive_handler(Offload(parse, Policy.process))`. Functions run by `Policy.process` must be
+        defined at module level, so they can be pickled.
+        :param policy: `Policy.inline` calls the function on the connection thread, `Policy.thread` uses a thread
+        pool, `Policy.process` uses a process pool, so CPU-bound work isn't limited by one GIL
+        :param executor: Existing `concurrent.futures.Executor` to use instead of creating one for the policy
+        :param max_workers: Amount of workers of the created executor
+        :param max_pending: Maximum amount of unfinished messages of one connection. The connection thread waits (and
+        stops reading from the socket) while it is reached
+        """
+        if max_pending < 1:
+            raise ValueError('max_pending must be at least 1')
+
+        self.function = function
+        self.policy = policy
+        self.max_pending = max_pending
+        self._owns_executor = executor is None and policy is not Policy.inline
+        if executor is not None:
+            self.executor = executor
+        elif policy is Policy.thread:
+            self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='sttcp-offload')
+        elif policy is Policy.process:
+            self.executor = ProcessPoolExecutor(max_workers)
+        else:
+            self.executor = None
+
+        self._lock = threading.Lock()
+        self._connections = weakref.WeakKeyDictionary()
+
+    def __call__(self, addr, connection, data) -> None:
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        if self.executor is None:
+            self._send(connection, self.function(data))
+            return None
+
+        with self._lock:
+            pending = self._connections.get(connection)
+            if pending is None:
+                pending = self._connections[connection] = _Pending(self.max_pending)
+
+        pending.space.acquire()
+        try:
+            future = self.executor.submit(self.function, data)
+        except BaseException:
+            pending.space.release()
+            raise
+        with pending.lock:
+            pending.futures.append(future)
+            if pending.sender is None:
+                pending.sender = threading.Thread(target=self._sender, args=(connection, pending),
+                                                  name='sttcp-offload-sender', daemon=True)
+                pending.sender.start()
+            else:
+                pending.lock.notify()
+        return None
+
+    def _sender(self, connection, pending: _Pending):
+        """Sends results of a connection in order. Stops after being idle for a while, `__call__` starts it again"""
+        while True:
+            with pending.lock:
+                if not pending.lock.wait_for(lambda: pending.futures, _SENDER_IDLE):
+                    pending.sender = None
+                    return
+                future = pending.futures[0]
+
+            try:
+                result = future.result()
+            except Exception:
+                message = ('\033[91mOh no! Something went wrong in your handler! Check it out and find '
+                           'problems:\033[0m')
+                message += '\n' + traceback.format_exc()
+                message += '\n' + '\033[91mDisconnecting the client\033[0m'
+                logger.error(message)
+                result = None
+                self._abort(connection)
+
+            with pending.lock:
+                pending.futures.popleft()
+            pending.space.release()
+
+            try:
+                self._send(connection, result)
+            except OSError:
+                self._abort(connection)
+
+    @staticmethod
+    def _send(connection, result):
+        if result is None:
+            return
+        send_message = getattr(connection, 'send_message', None)
+        if send_message is not None:
+            send_message(result)
+        else:
+            connection.sendall(result)
+
+    @staticmethod
+    def _abort(connection):
+        try:
+            getattr(connection, 'socket', connection).shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def pending(self, connection) -> int:
+        """Returns amount of unfinished messages of a connection"""
+        pending = self._connections.get(connection)
+        return 0 if pending is None else len(pending.futures)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stops the executor if it was created by this handler"""
+        if self._owns_executor:
+            self.executor.shutdown(wait)
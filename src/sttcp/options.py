@@ -0,0 +1,62 @@
+import socket
+import struct
+from typing import Union
+
+
+class SocketOptions:
+    def __init__(self, nodelay: bool = True, recv_buffer: Union[int, None] = None,
+                 send_buffer: Union[int, None] = None, backlog: Union[int, None] = socket.SOMAXCONN,
+                 reuse_address: bool = True, reuse_port: bool = False, quickack: bool = False,
+                 linger: Union[int, None] = None):
+        """
+        Socket options of listening, accepted and client sockets. Options unsupported by the platform or transport are
+        skipped.
+        :param nodelay: Disable Nagle's algorithm (`TCP_NODELAY`), so small writes are sent at once
+        :param recv_buffer: Kernel receive buffer size (`SO_RCVBUF`)
+        :param send_buffer: Kernel send buffer size (`SO_SNDBUF`)
+        :param backlog: Length of the queue of not accepted connections
+        :param reuse_address: Bind listening sockets while old connections are in `TIME_WAIT` (`SO_REUSEADDR`)
+        :param reuse_port: Let several listening sockets bind the same port (`SO_REUSEPORT`)
+        :param quickack: Send ACKs at once instead of delaying them (`TCP_QUICKACK`, Linux). It is set once per
+        connection and the kernel may turn it off again
+        :param linger: Seconds `close()` waits for unsent data, 0 resets the connection at once (`SO_LINGER`)
+        """
+        self.nodelay = nodelay
+        self.recv_buffer = recv_buffer
+        self.send_buffer = send_buffer
+        self.backlog = backlog
+        self.reuse_address = reuse_address
+        self.reuse_port = reuse_port
+        self.quickack = quickack
+        self.linger = linger
+
+    def _buffers(self, sock: socket.socket) -> None:
+        if self.recv_buffer is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer)
+        if self.send_buffer is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+
+    def apply_listening(self, sock: socket.socket, tcp: bool = True) -> None:
+        """Sets options of a listening socket, must be called before `bind`. Accepted sockets inherit buffer sizes"""
+        if self.reuse_address and tcp and hasattr(socket, 'SO_REUSEADDR'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port and tcp and hasattr(socket, 'SO_REUSEPORT'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self._buffers(sock)
+
+    def listen(self, sock: socket.socket) -> None:
+        if self.backlog is None:
+            sock.listen()
+        else:
+            sock.listen(self.backlog)
+
+    def apply(self, sock: socket.socket, tcp: bool = True) -> None:
+        """Sets options of an accepted or a client socket. Client sockets must be configured before `connect`"""
+        self._buffers(sock)
+        if tcp:
+            if self.nodelay:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.quickack and hasattr(socket, 'TCP_QUICKACK'):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        if self.linger is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, self.linger))
@@ -0,0 +1,43 @@
+import struct
+from typing import Tuple
+
+_header = struct.Struct('!Q')
+
+
+class RequestTimeoutError(TimeoutError):
+    """Set to `Client.request` future when no response was received in time."""
+    pass
+
+
+class ProtocolError(ValueError):
+    """Raised when a pipelined message is too short to contain a correlation ID."""
+    pass
+
+
+def pack(correlation_id: int, payload: bytes) -> bytes:
+    """Returns pipelined message body: 8 byte correlation ID followed by payload"""
+    return _header.pack(correlation_id) + payload
+
+
+def unpack(message: bytes) -> Tuple[int, bytes]:
+    """Returns `(correlation_id, payload)` of pipelined message body"""
+    if len(message) < _header.size:
+        raise ProtocolError('Message is too short to contain a correlation ID')
+    correlation_id, = _header.unpack_from(message)
+    return correlation_id, bytes(message[_header.size:])
+
+
+def responder(function):
+    """
+    Turns `function(address, connection, payload) -> Union[bytes, None]` into a `receive_handler` answering
+    `sttcp.client.Client.request` calls. The server must use `framer=sttcp.framing.LengthPrefixFramer`.
+    Returned bytes are sent back with the correlation ID of the request, None sends nothing.
+    """
+    def receive_handler(addr, connection, data):
+        correlation_id, payload = unpack(data)
+        response = function(addr, connection, payload)
+        if response is not None:
+            connection.send_message(pack(correlation_id, response))
+
+    receive_handler.__wrapped__ = function
+    return receive_handler
@@ -0,0 +1,254 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Union
+try:
+    from . import logger
+    from .client import Client
+    from .transport import format_address
+except ImportError:
+    from sttcp import logger
+    from sttcp.client import Client
+    from sttcp.transport import format_address
+
+
+class PoolTimeoutError(TimeoutError):
+    """Raised by `ClientPool.lease` when no client became free in time."""
+    pass
+
+
+def _quiet_unconnected(addr: tuple, e: Exception):
+    logger.warning(f'Couldn\'t connect to {format_address(addr)}: {e!r}')
+
+
+def _healthy(client: Client) -> bool:
+    return client.is_connected and not client.closed
+
+
+class _Bucket:
+    __slots__ = ('idle', 'size', 'created', 'replaced')
+
+    def __init__(self):
+        self.idle = deque()
+        self.size = 0
+        self.created = 0
+        self.replaced = 0
+
+
+class ClientPool:
+    def __init__(self, min_size: int = 0, max_size: int = 8, factory=None, health_check=None,
+                 connect_timeout: Union[float, None] = 5.0, **options):
+        """
+        Pool of connected `sttcp.client.Client` instances kept per `(host, port)`, so every operation reuses an
+        established connection instead of paying TCP handshake and thread start. Clients are leased exclusively and
+        returned after use. Closed clients are dropped and replaced by new ones on the next lease.
+        Default clients use pipelining, so a leased client sends requests with `request`:
+        `with pool.connection(host, port) as client: response = client.request(payload).result()`.
+        :param min_size: Amount of connections per address opened in background after the first lease (or `warmup`)
+        :param max_size: Maximum amount of connections per address, leased and idle together
+        :param factory: Function `(host, port) -> Client` which creates a not started client and sets its handlers.
+        By default `Client(host, port, pipelining=True, **options)`
+        :param health_check: Function `(client) -> bool` called before an idle client is leased. Unhealthy clients are
+        closed and replaced
+        :param connect_timeout: Maximum time to wait for a new connection
+        :param options: `sttcp.client.Client` parameters like `framer` or `compression` used by the default factory
+        """
+        if factory is None and not options.setdefault('pipelining', True):
+            raise ValueError('Clients of the default factory need pipelining, pass a factory to use other clients')
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+        if not 0 <= min_size <= max_size:
+            raise ValueError('min_size must be between 0 and max_size')
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.factory = factory
+        self.health_check = health_check
+        self.connect_timeout = connect_timeout
+        self.options = options
+
+        self._condition = threading.Condition()
+        self._buckets = {}
+        self._leased = {}
+        self._closed = False
+
+    def _create(self, key: tuple) -> Client:
+        host, port = key
+        if self.factory is not None:
+            client = self.factory(host, port)
+        else:
+            client = Client(host, port, **self.options)
+            client.unconnected_handler(_quiet_unconnected)
+        client.start()
+        if not client.wait_connected(self.connect_timeout):
+            client.close()
+            raise ConnectionError(f'Couldn\'t connect to {client.address}')
+        return client
+
+    def _check(self, client: Client) -> bool:
+        if not _healthy(client):
+            return False
+        if self.health_check is None:
+            return True
+        try:
+            return bool(self.health_check(client))
+        except Exception as e:
+            logger.warning(f'Health check of {client.address} failed: {e!r}')
+            return False
+
+    def _open(self, key: tuple, bucket: _Bucket, lease: bool) -> Union[Client, None]:
+        """Creates a client for a slot already reserved in `bucket.size`"""
+        try:
+            client = self._create(key)
+        except Exception:
+            with self._condition:
+                bucket.size -= 1
+                self._condition.notify_all()
+            raise
+
+        with self._condition:
+            bucket.created += 1
+            if self._closed:
+                bucket.size -= 1
+            elif lease:
+                self._leased[client] = key
+                return client
+            else:
+                bucket.idle.append(client)
+                self._condition.notify_all()
+                return None
+        client.close()
+        raise ConnectionError('Pool is closed')
+
+    def _replenish(self, key: tuple):
+        while True:
+            with self._condition:
+                bucket = self._buckets.get(key)
+                if self._closed or bucket is None or bucket.size >= self.min_size:
+                    return
+                bucket.size += 1
+            try:
+                self._open(key, bucket, False)
+            except Exception:
+                return
+
+    def _schedule_replenish(self, key: tuple, bucket: _Bucket):
+        if bucket.size < self.min_size:
+            threading.Thread(target=self._replenish, args=(key,), name='sttcp-pool-warmup', daemon=True).start()
+
+    def warmup(self, host: str, port: Union[str, int], wait: bool = True) -> None:
+        """
+        Opens `min_size` connections to the address.
+        :param wait: Block until connections are opened, otherwise they are opened in background
+        """
+        key = (host, port)
+        with self._condition:
+            self._buckets.setdefault(key, _Bucket())
+        if wait:
+            self._replenish(key)
+        else:
+            threading.Thread(target=self._replenish, args=(key,), name='sttcp-pool-warmup', daemon=True).start()
+
+    def lease(self, host: str, port: Union[str, int], timeout: Union[float, None] = None) -> Client:
+        """
+        Takes a connected client to the address. It must be given back with `release`.
+        :param timeout: Maximum time to wait for a free client when `max_size` clients are leased
+        :return: Started and connected `sttcp.client.Client`
+        """
+        key = (host, port)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._condition:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = _Bucket()
+
+                while not bucket.idle and bucket.size >= self.max_size and not self._closed:
+                    left = None if deadline is None else deadline - time.monotonic()
+                    if left is not None and left <= 0:
+                        address = format_address(host if port is None else key)
+                        raise PoolTimeoutError(f'No free client to {address} in {timeout} seconds')
+                    self._condition.wait(left)
+
+                if self._closed:
+                    raise ConnectionError('Pool is closed')
+                if not bucket.idle:
+                    bucket.size += 1
+                    self._schedule_replenish(key, bucket)
+                    break
+                client = bucket.idle.pop()
+                self._leased[client] = key
+
+            if self._check(client):
+                return client
+            self.release(client, broken=True)
+
+        return self._open(key, bucket, True)
+
+    def release(self, client: Client, broken: bool = False) -> None:
+        """
+        Gives a leased client back to the pool.
+        :param broken: Close the client instead of reusing it, for example after an unfinished exchange
+        """
+        with self._condition:
+            key = self._leased.pop(client, None)
+            if key is None:
+                raise ValueError('Client is not leased from this pool')
+            bucket = self._buckets[key]
+            if broken or self._closed or not _healthy(client):
+                bucket.size -= 1
+                if not self._closed:
+                    bucket.replaced += 1
+                    self._schedule_replenish(key, bucket)
+            else:
+                bucket.idle.append(client)
+                client = None
+            self._condition.notify_all()
+
+        if client is not None:
+            client.close()
+
+    @contextmanager
+    def connection(self, host: str, port: Union[str, int], timeout: Union[float, None] = None):
+        """
+        Leases a client for a `with` block. The client is closed instead of being reused if the block raised
+        `ConnectionError` or `OSError`.
+        """
+        client = self.lease(host, port, timeout)
+        broken = False
+        try:
+            yield client
+        except OSError:
+            broken = True
+            raise
+        finally:
+            self.release(client, broken)
+
+    def stats(self) -> dict:
+        """Returns `{(host, port): {...}}` with amounts of idle and leased clients of every address"""
+        with self._condition:
+            return {key: {'size': bucket.size, 'idle': len(bucket.idle), 'leased': bucket.size - len(bucket.idle),
+                          'created': bucket.created, 'replaced': bucket.replaced}
+                    for key, bucket in self._buckets.items()}
+
+    def close(self) -> None:
+        """Closes idle clients. Leased clients are closed when they are released"""
+        with self._condition:
+            self._closed = True
+            idle = [client for bucket in self._buckets.values() for client in bucket.idle]
+            for bucket in self._buckets.values():
+                bucket.size -= len(bucket.idle)
+                bucket.idle.clear()
+            self._condition.notify_all()
+
+        for client in idle:
+            client.close()
+        for client in idle:
+            client.wait_closed(self.connect_timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,265 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Union
+try:
+    from . import connections, connections_lock, logger
+    from .server import Server, _default_connection, _default_receive, _default_disconnection, _default_universal
+    from .transport import Transport, detect, format_address
+    from .options import SocketOptions
+except ImportError:
+    from sttcp import connections, connections_lock, logger
+    from sttcp.server import Server, _default_connection, _default_receive, _default_disconnection, _default_universal
+    from sttcp.transport import Transport, detect, format_address
+    from sttcp.options import SocketOptions
+
+
+class ProcessServer:
+    HandlerType = Server.HandlerType
+
+    def __init__(self, host: str, port: Union[str, int, None], processes: Union[int, None] = None,
+                 reuse_port: bool = True, restart: bool = True, restart_delay: float = 1.0,
+                 transport: Union[Transport, None] = None, socket_options: Union[bool, SocketOptions] = False,
+                 **options):
+        """
+        Represents server TCP connection served by several forked worker processes, so handlers are not limited by
+        one GIL. Every process runs `sttcp.server.Server` with the same handlers. Handlers must be set before
+        `start()`. Requires `os.fork` (Linux, macOS).
+        :param processes: Amount of worker processes, `os.cpu_count()` by default
+        :param reuse_port: Every worker listens on its own `SO_REUSEPORT` socket and the kernel balances connections
+        between them. If False (or `SO_REUSEPORT` is unavailable) workers share one inherited listening socket
+        :param restart: Restart worker processes which exited while the server is running
+        :param restart_delay: Minimal delay between restarts of one worker
+        :param transport: `sttcp.transport.TCP`, `TCP6` or `Unix` (detected from `host` and `port` by default). Unix
+        sockets are always shared
+        :param socket_options: `sttcp.options.SocketOptions` of listening and accepted sockets, see
+        `sttcp.server.Server`
+        :param options: `sttcp.server.Server` parameters like `workers`, `framer` or `buffer_size`
+        """
+        if not hasattr(os, 'fork'):
+            raise OSError('ProcessServer requires os.fork')
+
+        self._connection_handler = _default_connection
+        self._receive_handler = _default_receive
+        self._disconnection_handler = _default_disconnection
+        self._universal_handler = _default_universal
+
+        self.host = host
+        self.port = port
+        self.transport = transport or detect(host, port)
+        self.sock_name = self.transport.address(self.host, self.port)
+        self.address = format_address(self.sock_name)
+        self.processes = processes or os.cpu_count() or 1
+        self.reuse_port = reuse_port and self.transport.tcp and hasattr(socket, 'SO_REUSEPORT')
+        self.restart = restart
+        self.restart_delay = restart_delay
+        self.socket_options = SocketOptions() if socket_options is True else socket_options or None
+        self.options = options
+        self.restarts = 0
+
+        self.is_listening = False
+        self._context = multiprocessing.get_context('fork')
+        self._workers = []
+        self._started = []
+
+        self._socket_thread = threading.Thread(target=self._supervise, daemon=True)
+        self._socket_thread.shutdown = False
+        self._wakeup_receiver, self._wakeup_sender = socket.socketpair()
+        self._listening_event = threading.Event()
+        self._closed_event = threading.Event()
+        self.closed = False
+
+    def _create_socket(self) -> socket.socket:
+        s = self.transport.create_socket()
+        if self.socket_options is not None:
+            self.socket_options.apply_listening(s, self.transport.tcp)
+        if self.reuse_port:
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self.transport.bind(s, self.sock_name)
+        return s
+
+    def _worker(self, index: int):
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self._wakeup_receiver.close()
+        self._wakeup_sender.close()
+
+        if self.reuse_port:
+            self._socket.close()
+            sock = self._create_socket()
+        else:
+            sock = self._socket
+
+        server = Server(self.host, self.port, sock=sock, transport=self.transport, socket_options=self.socket_options,
+                        **self.options)
+        server.connection_handler(self._connection_handler)
+        server.receive_handler(self._receive_handler)
+        server.disconnection_handler(self._disconnection_handler)
+        server.universal_handler(self._universal_handler)
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.close())
+        server.start()
+        server.wait_closed()
+        logger.flush(1)
+
+    def _spawn(self, index: int):
+        process = self._context.Process(target=self._worker, args=(index,), name=f'sttcp-worker-{index}',
+                                        daemon=True)
+        process.start()
+        self._workers[index] = process
+        self._started[index] = time.monotonic()
+
+    def _supervise(self):
+        try:
+            while not self._socket_thread.shutdown:
+                sentinels = {process.sentinel: index for index, process in enumerate(self._workers)
+                             if process is not None}
+                if not sentinels:
+                    break
+
+                ready = multiprocessing.connection.wait(list(sentinels) + [self._wakeup_receiver])
+                for sentinel in ready:
+                    index = sentinels.get(sentinel)
+                    if index is None or self._socket_thread.shutdown:
+                        continue
+
+                    process = self._workers[index]
+                    process.join()
+                    if not self.restart:
+                        logger.warning(f'Worker {process.name} exited with code {process.exitcode}')
+                        self._workers[index] = None
+                        continue
+
+                    logger.warning(f'Worker {process.name} exited with code {process.exitcode}, restarting')
+                    delay = self._started[index] + self.restart_delay - time.monotonic()
+                    if delay > 0 and multiprocessing.connection.wait([self._wakeup_receiver], delay):
+                        break
+                    self.restarts += 1
+                    self._spawn(index)
+        finally:
+            self._stop_workers()
+
+    def _stop_workers(self, timeout: float = 5.0):
+        for process in self._workers:
+            if process is not None and process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + timeout
+        for process in self._workers:
+            if process is not None:
+                process.join(max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+
+        logger.info(f'Stopped server {format_address(self.sock_name)}')
+
+        self._socket.close()
+        self.transport.cleanup(self.sock_name)
+        self._wakeup_receiver.close()
+        self._wakeup_sender.close()
+        self.closed = True
+        with connections_lock:
+            connections.remove(self)
+        self._listening_event.set()
+        self._closed_event.set()
+
+    def start(self):
+        """Starts listening socket and worker processes"""
+        self._socket = self._create_socket()
+        if not self.reuse_port:
+            if self.socket_options is not None:
+                self.socket_options.listen(self._socket)
+            else:
+                self._socket.listen()
+        self.sock_name = self._socket.getsockname()
+
+        self._workers = [None] * self.processes
+        self._started = [0.0] * self.processes
+        for index in range(self.processes):
+            self._spawn(index)
+
+        logger.info(f'Listening to {format_address(self.sock_name)} with {self.processes} processes')
+
+        self.is_listening = True
+        self._listening_event.set()
+        with connections_lock:
+            connections.append(self)
+        self._socket_thread.start()
+
+    def close(self):
+        """Stops worker processes. Use `wait_closed` to wait until every worker is stopped"""
+        self._socket_thread.shutdown = True
+        try:
+            self._wakeup_sender.send(b'\0')
+        except OSError:
+            pass
+
+    def stop(self):
+        """Alternative of .close()"""
+        self.close()
+
+    def wait_listening(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Blocks until the server is listening.
+        :return: False if timeout expired
+        """
+        self._listening_event.wait(timeout)
+        return self.is_listening
+
+    def wait_closed(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Blocks until every worker process is stopped.
+        :return: False if timeout expired
+        """
+        return self._closed_event.wait(timeout)
+
+    def alive(self) -> int:
+        """Returns amount of running worker processes"""
+        return sum(1 for process in self._workers if process is not None and process.is_alive())
+
+    def connection_handler(self, function) -> None:
+        """
+        Sets a connection handler for TCP server.
+        :param function: Function handler parameter with `"address: tuple"`, `"connection: socket.socket"` parameters`
+        """
+        self._connection_handler = function
+
+    def receive_handler(self, function) -> None:
+        """
+        Sets a reception handler for TCP server.
+        :param function: Function handler parameter with `"address: tuple"`, `"connection: socket.socket"`,
+        `"data: bytes"` parameters`
+        """
+        self._receive_handler = function
+
+    def disconnection_handler(self, function) -> None:
+        """
+        Sets a disconnection handler for TCP server.
+        :param function: Function handler parameter with `"address: tuple"` parameter`
+        """
+        self._disconnection_handler = function
+
+    def universal_handler(self, function) -> None:
+        """
+        Sets a universal handler for TCP server.
+        :param function: Function handler parameter with `"handler_type: sttcp.server.Server.HandlerType"`,
+        `"address: tuple"`, `"connection: Union[socket.socket, None]"`, `"data: Union[bytes, None]"` parameters`
+        """
+        self._universal_handler = function
+
+    def keep_alive(self):
+        """Use it to make server stoppable only by KeyboardInterrupt exception."""
+        try:
+            if self.wait_listening():
+                logger.info('Press Ctrl + C to stop server!')
+
+            self.wait_closed()
+        except KeyboardInterrupt:
+            logger.info('Stopping server...')
+
+            self.close()
+            self.wait_closed()
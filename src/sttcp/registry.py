@@ -0,0 +1,168 @@
+import itertools
+import socket
+import threading
+from typing import Union
+try:
+    from .writer import Writer, WriterClosedError
+except ImportError:
+    from sttcp.writer import Writer, WriterClosedError
+
+
+class _Entry:
+    __slots__ = ('id', 'address', 'connection', 'writer', 'owns_writer', 'groups')
+
+    def __init__(self, client_id: int, address, connection):
+        self.id = client_id
+        self.address = address
+        self.connection = connection
+        self.writer = getattr(connection, 'writer', None)
+        self.owns_writer = False
+        self.groups = set()
+
+
+class Registry:
+    def __init__(self, writer=Writer):
+        """
+        Thread safe registry of live client connections of a server. Clients are found by ID (returned by `add`) or
+        by address, and can be put to named groups.
+        :param writer: Factory of `sttcp.writer.Writer` used by `broadcast` for connections without their own writer
+        """
+        self.writer = writer
+        self.dropped = 0
+
+        self._lock = threading.Lock()
+        self._empty = threading.Condition(self._lock)
+        self._ids = itertools.count(1)
+        self._entries = {}
+        self._addresses = {}
+        self._groups = {}
+
+    def _find(self, key) -> Union[_Entry, None]:
+        if isinstance(key, int):
+            return self._entries.get(key)
+        client_id = self._addresses.get(key)
+        return None if client_id is None else self._entries.get(client_id)
+
+    def add(self, address, connection) -> int:
+        """Registers connection and returns its ID"""
+        with self._lock:
+            client_id = next(self._ids)
+            self._entries[client_id] = _Entry(client_id, address, connection)
+            self._addresses[address] = client_id
+        return client_id
+
+    def remove(self, key) -> None:
+        """Unregisters connection by ID or address"""
+        with self._lock:
+            entry = self._find(key)
+            if entry is None:
+                return
+            del self._entries[entry.id]
+            if self._addresses.get(entry.address) == entry.id:
+                del self._addresses[entry.address]
+            for group in entry.groups:
+                members = self._groups.get(group)
+                if members is not None:
+                    members.discard(entry.id)
+                    if not members:
+                        del self._groups[group]
+            if not self._entries:
+                self._empty.notify_all()
+        if entry.owns_writer:
+            entry.writer.close(flush=False)
+
+    def get(self, key):
+        """Returns connection by ID or address or None"""
+        with self._lock:
+            entry = self._find(key)
+            return None if entry is None else entry.connection
+
+    def items(self) -> list:
+        """Returns list of `(id, address, connection)` tuples"""
+        with self._lock:
+            return [(entry.id, entry.address, entry.connection) for entry in self._entries.values()]
+
+    def join(self, group: str, key) -> None:
+        """Adds connection (by ID or address) to a group"""
+        with self._lock:
+            entry = self._find(key)
+            if entry is None:
+                raise KeyError(key)
+            entry.groups.add(group)
+            self._groups.setdefault(group, set()).add(entry.id)
+
+    def leave(self, group: str, key) -> None:
+        """Removes connection (by ID or address) from a group"""
+        with self._lock:
+            entry = self._find(key)
+            if entry is None:
+                return
+            entry.groups.discard(group)
+            members = self._groups.get(group)
+            if members is not None:
+                members.discard(entry.id)
+                if not members:
+                    del self._groups[group]
+
+    def members(self, group: str) -> list:
+        """Returns connections of a group"""
+        with self._lock:
+            return [self._entries[client_id].connection for client_id in self._groups.get(group, ())]
+
+    def broadcast(self, data: bytes, group: Union[str, None] = None, exclude=None) -> int:
+        """
+        Queues the same `data` to every connection (or to every connection of `group`) without waiting for any of
+        them. Connections whose send queue is above the high watermark are skipped and counted in `dropped`.
+        If handlers use `sendall` of raw sockets at the same time, configure server `writer` so both are sent
+        through one queue.
+        :param exclude: ID, address or connection which doesn't receive data
+        :return: Amount of connections data was queued to
+        """
+        if not isinstance(data, bytes):
+            data = bytes(data)
+
+        with self._lock:
+            if group is None:
+                entries = list(self._entries.values())
+            else:
+                entries = [self._entries[client_id] for client_id in self._groups.get(group, ())]
+            for entry in entries:
+                if entry.writer is None:
+                    sock = getattr(entry.connection, 'socket', entry.connection)
+                    if isinstance(sock, socket.socket):
+                        entry.writer = self.writer(sock)
+                        entry.owns_writer = True
+
+        delivered = 0
+        for entry in entries:
+            if exclude is not None and exclude in (entry.id, entry.address, entry.connection):
+                continue
+            if entry.writer is None:
+                continue
+            try:
+                if entry.writer.write(data, block=False):
+                    delivered += 1
+                else:
+                    self.dropped += 1
+            except WriterClosedError:
+                pass
+        return delivered
+
+    def wait_empty(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Blocks until every connection is removed.
+        :return: False if timeout expired
+        """
+        with self._lock:
+            return self._empty.wait_for(lambda: not self._entries, timeout)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._find(key) is not None
+
+    def __iter__(self):
+        with self._lock:
+            return iter([entry.connection for entry in self._entries.values()])
@@ -0,0 +1,182 @@
+import socket
+import struct
+import threading
+import time
+from typing import Iterator, Tuple, Union
+try:
+    from .transport import Transport, detect
+except ImportError:
+    from sttcp.transport import Transport, detect
+
+_MAGIC = b'STTCPREC\x01'
+_event = struct.Struct('!BQdI')
+
+OPENED = 1
+RECEIVED = 2
+CLOSED = 3
+
+
+class Recorder:
+    def __init__(self, path: str):
+        """
+        Records received byte streams of `sttcp.server.Server` connections with their timing into a file, pass it as
+        `Server(..., recorder=Recorder('session.rec'))`. Only client to server bytes are recorded, responses are what
+        the server sends again on replay. Every event is a 21 byte header followed by received bytes. The server
+        closes the recorder when it and its last connection are closed. Replay the file with `replay`.
+        """
+        self.path = path
+        self._file = open(path, 'wb')
+        self._file.write(_MAGIC)
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self.connections = 0
+        self.bytes = 0
+
+    def _write(self, kind: int, connection_id: int, data=b'') -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            if kind == OPENED:
+                self.connections += 1
+            self.bytes += len(data)
+            self._file.write(_event.pack(kind, connection_id, time.monotonic() - self._start, len(data)))
+            if data:
+                self._file.write(data)
+
+    def opened(self, connection_id: int) -> None:
+        self._write(OPENED, connection_id)
+
+    def received(self, connection_id: int, data: Union[bytes, bytearray, memoryview]) -> None:
+        self._write(RECEIVED, connection_id, data)
+
+    def closed(self, connection_id: int) -> None:
+        self._write(CLOSED, connection_id)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def load(path: str) -> Iterator[Tuple[int, int, float, bytes]]:
+    """
+    Yields `(kind, connection_id, seconds, data)` events of a recorded file, reading them one by one. An event cut
+    off at the end of the file is skipped
+    """
+    with open(path, 'rb') as file:
+        if file.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f'{path} is not an sttcp recording')
+
+        while True:
+            header = file.read(_event.size)
+            if len(header) < _event.size:
+                return
+            kind, connection_id, seconds, size = _event.unpack(header)
+            data = file.read(size)
+            if len(data) < size:
+                return
+            yield kind, connection_id, seconds, data
+
+
+def _drain(sock: socket.socket, received: list) -> None:
+    try:
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            received[0] += len(data)
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+
+def replay(path: str, host: str, port: Union[str, int, None], speed: Union[float, None] = 1.0,
+           transport: Union[Transport, None] = None, timeout: Union[float, None] = 10.0) -> dict:
+    """
+    Replays a recording against a server: opens the recorded connections, sends the recorded bytes and closes them
+    in the original order. Responses are read and counted.
+    :param speed: Multiplier of the recorded pace, like 2.0 for twice as fast. None sends everything without pauses
+    :param transport: `sttcp.transport` class of the server, detected from `host` and `port` by default
+    :param timeout: Seconds to wait for the server to close replayed connections at the end
+    :return: Amounts of connections, failed connections, sent and received bytes, duration and the maximum lag
+    behind the schedule in seconds
+    """
+    transport = transport or detect(host, port)
+    address = transport.address(host, port)
+    sockets = {}
+    readers = []
+    failed = 0
+    sent = 0
+    lag = 0.0
+
+    first = None
+    start = time.monotonic()
+    for kind, connection_id, seconds, data in load(path):
+        if first is None:
+            first = seconds
+        if speed:
+            delay = start + (seconds - first) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lag = max(lag, -delay)
+
+        if kind == OPENED:
+            sock = transport.create_socket()
+            try:
+                transport.connect(sock, address)
+            except OSError:
+                sock.close()
+                failed += 1
+                continue
+            sockets[connection_id] = sock
+            received = [0]
+            reader = threading.Thread(target=_drain, args=(sock, received), daemon=True)
+            reader.start()
+            readers.append((reader, received, sock))
+        elif kind == RECEIVED:
+            sock = sockets.get(connection_id)
+            if sock is None:
+                continue
+            try:
+                sock.sendall(data)
+                sent += len(data)
+            except OSError:
+                failed += 1
+                del sockets[connection_id]
+        elif kind == CLOSED:
+            sock = sockets.pop(connection_id, None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+
+    for sock in sockets.values():
+        try:
+            sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for reader, _, sock in readers:
+        reader.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        if reader.is_alive():
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    return {
+        'connections': len(readers),
+        'failed': failed,
+        'bytes_sent': sent,
+        'bytes_received': sum(received[0] for _, received, _ in readers),
+        'duration': time.monotonic() - start,
+        'lag': lag,
+    }
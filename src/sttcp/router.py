@@ -0,0 +1,75 @@
+import struct
+from typing import Union
+
+
+class UnknownRouteError(LookupError):
+    """Raised when a message has an opcode without a route and no default handler is set."""
+    pass
+
+
+class Router:
+    def __init__(self, header: str = '!B', default=None):
+        """
+        Dispatches framed messages to handlers by an opcode at the start of every message. The router is a receive (or
+        response) handler itself: `server.receive_handler(router)`, or use `@server.route(opcode)`.
+        One byte opcodes are looked up in a 256 item table, wider ones in a dict.
+        :param header: `struct` format of the opcode, like `'!B'` or `'!H'`
+        :param default: Handler of messages with unknown opcodes, `(address, connection, opcode, payload)`
+        """
+        self._header = struct.Struct(header)
+        self.default = default
+        self._single = self._header.size == 1 and self._header.format[-1:] == 'B'
+        self._table = [None] * 256 if self._single else {}
+
+    def route(self, opcode: int):
+        """
+        Decorator which registers a handler `(address, connection, payload)` of messages with `opcode`.
+        The return value of the handler is returned to the caller (like `response_handler` of the client).
+        """
+        self._header.pack(opcode)
+
+        def decorator(function):
+            self._table[opcode] = function
+            return function
+        return decorator
+
+    def add(self, opcode: int, function) -> None:
+        """Registers a handler of messages with `opcode`"""
+        self.route(opcode)(function)
+
+    def remove(self, opcode: int) -> None:
+        if self._single:
+            self._table[opcode] = None
+        else:
+            self._table.pop(opcode, None)
+
+    def pack(self, opcode: int, payload: Union[bytes, bytearray, memoryview] = b'') -> bytes:
+        """Returns message body with `opcode`, send it with `connection.send_message`"""
+        return self._header.pack(opcode) + payload
+
+    def __call__(self, addr, connection, data):
+        size = self._header.size
+        if len(data) < size:
+            raise UnknownRouteError(f'Message is shorter than the {size} byte opcode')
+        if self._single:
+            opcode = data[0]
+            function = self._table[opcode]
+        else:
+            opcode, = self._header.unpack_from(data)
+            function = self._table.get(opcode)
+
+        if function is None:
+            if self.default is None:
+                raise UnknownRouteError(f'No route for opcode {opcode:#x}')
+            return self.default(addr, connection, opcode, data[size:])
+        return function(addr, connection, data[size:])
+
+    def __contains__(self, opcode: int):
+        if self._single:
+            return 0 <= opcode < 256 and self._table[opcode] is not None
+        return opcode in self._table
+
+    def __len__(self):
+        if self._single:
+            return sum(function is not None for function in self._table)
+        return len(self._table)
@@ -0,0 +1,201 @@
+import struct
+from collections import namedtuple
+from functools import lru_cache
+from typing import Iterable, List, Union
+
+_length = struct.Struct('!I')
+_VARIABLE = ('bytes', 'str')
+
+
+class SchemaError(ValueError):
+    """Raised when a message doesn't match its schema."""
+    pass
+
+
+@lru_cache(maxsize=None)
+def _compile(fields: tuple, byte_order: str) -> tuple:
+    """
+    Returns steps of a schema: runs of fixed size fields joined into one `struct.Struct` and variable size fields
+    between them. Equal schemas share their compiled steps.
+    """
+    steps = []
+    run = ''
+    count = 0
+    for _, kind in fields:
+        if kind in _VARIABLE:
+            if run:
+                steps.append((struct.Struct(byte_order + run), count))
+                run, count = '', 0
+            steps.append((kind, 1))
+            continue
+        run += kind
+        count += 1
+    if run:
+        steps.append((struct.Struct(byte_order + run), count))
+    return tuple(steps)
+
+
+class Schema:
+    def __init__(self, name: str, fields, byte_order: str = '!'):
+        """
+        Binary layout of a message, declared once and compiled into cached `struct.Struct` packers. Records are
+        named tuples, so handlers work with fields instead of parsing bytes.
+        Schema of fixed size fields is packed and unpacked with a single `struct` call.
+        :param name: Name of the record type
+        :param fields: `(name, kind)` pairs or a dict. Kind is a `struct` format of one field (like `'I'`, `'d'` or
+        `'16s'`), `'bytes'` or `'str'` (UTF-8) for variable size fields prefixed with 4 byte length
+        :param byte_order: `struct` byte order character, network order by default
+        """
+        fields = tuple(fields.items() if isinstance(fields, dict) else fields)
+        for field, kind in fields:
+            if kind not in _VARIABLE and len(struct.unpack('!' + kind, bytes(struct.calcsize('!' + kind)))) != 1:
+                raise ValueError(f'Field "{field}" must have a format of one value, not "{kind}"')
+
+        self.name = name
+        self.fields = fields
+        self.byte_order = byte_order
+        self.type = namedtuple(name, [field for field, _ in fields])
+        self._steps = _compile(fields, byte_order)
+        self._names = self.type._fields
+        self._struct = self._steps[0][0] if len(self._steps) == 1 and self._steps[0][0] not in _VARIABLE else None
+
+    @property
+    def size(self) -> Union[int, None]:
+        """Size of packed records or None if the schema has variable size fields"""
+        return None if self._struct is None else self._struct.size
+
+    def record(self, *args, **kwargs):
+        """Returns a new record of this schema"""
+        return self.type(*args, **kwargs)
+
+    def pack(self, record) -> bytes:
+        """
+        Returns packed record. Record is a named tuple, a tuple of values in the order of fields or a dict.
+        """
+        if isinstance(record, dict):
+            record = [record[field] for field in self._names]
+        try:
+            if self._struct is not None:
+                return self._struct.pack(*record)
+            return b''.join(self._pack_parts(record))
+        except (struct.error, TypeError, AttributeError) as e:
+            raise SchemaError(f'Record does not match schema {self.name}: {e}') from None
+
+    def _pack_parts(self, record) -> List[bytes]:
+        parts = []
+        index = 0
+        for step, count in self._steps:
+            if step == 'str':
+                value = record[index].encode('utf-8')
+                parts.append(_length.pack(len(value)))
+                parts.append(value)
+            elif step == 'bytes':
+                value = record[index]
+                parts.append(_length.pack(len(value)))
+                parts.append(value)
+            else:
+                parts.append(step.pack(*record[index:index + count]))
+            index += count
+        return parts
+
+    def unpack(self, data: Union[bytes, bytearray, memoryview]):
+        """Returns record of a message. Raises `SchemaError` if the message size doesn't match the schema"""
+        record, offset = self.unpack_from(data)
+        if offset != len(data):
+            raise SchemaError(f'Message has {len(data) - offset} bytes after a record of schema {self.name}')
+        return record
+
+    def unpack_from(self, data: Union[bytes, bytearray, memoryview], offset: int = 0) -> tuple:
+        """
+        Returns `(record, offset)`, where offset points to the first byte after the record.
+        """
+        try:
+            if self._struct is not None:
+                return self.type._make(self._struct.unpack_from(data, offset)), offset + self._struct.size
+
+            values = []
+            for step, _ in self._steps:
+                if step in _VARIABLE:
+                    size, = _length.unpack_from(data, offset)
+                    offset += _length.size
+                    if offset + size > len(data):
+                        raise struct.error(f'{size} bytes field is longer than the rest of the message')
+                    value = data[offset:offset + size]
+                    values.append(str(value, 'utf-8') if step == 'str' else bytes(value))
+                    offset += size
+                else:
+                    values.extend(step.unpack_from(data, offset))
+                    offset += step.size
+            return self.type._make(values), offset
+        except (struct.error, UnicodeDecodeError) as e:
+            raise SchemaError(f'Message does not match schema {self.name}: {e}') from None
+
+    def pack_many(self, records: Iterable) -> bytes:
+        """Returns packed records prefixed with 4 byte amount of them"""
+        records = list(records)
+        if self._struct is None:
+            parts = [_length.pack(len(records))]
+            for record in records:
+                parts.append(self.pack(record))
+            return b''.join(parts)
+
+        size = self._struct.size
+        buffer = bytearray(_length.size + len(records) * size)
+        _length.pack_into(buffer, 0, len(records))
+        pack_into = self._struct.pack_into
+        offset = _length.size
+        try:
+            for record in records:
+                pack_into(buffer, offset, *([record[field] for field in self._names] if isinstance(record, dict)
+                                            else record))
+                offset += size
+        except (struct.error, TypeError) as e:
+            raise SchemaError(f'Record does not match schema {self.name}: {e}') from None
+        return bytes(buffer)
+
+    def unpack_many(self, data: Union[bytes, bytearray, memoryview]) -> list:
+        """Returns list of records packed by `pack_many`"""
+        if len(data) < _length.size:
+            raise SchemaError('Message is too short to contain the amount of records')
+        count, = _length.unpack_from(data)
+        if self._struct is not None:
+            end = _length.size + count * self._struct.size
+            if end != len(data):
+                raise SchemaError(f'Message size does not match {count} records of schema {self.name}')
+            return list(map(self.type._make, self._struct.iter_unpack(memoryview(data)[_length.size:end])))
+
+        records = []
+        offset = _length.size
+        for _ in range(count):
+            record, offset = self.unpack_from(data, offset)
+            records.append(record)
+        if offset != len(data):
+            raise SchemaError(f'Message has {len(data) - offset} bytes after records of schema {self.name}')
+        return records
+
+    def handler(self, function, response: Union['Schema', None] = None, many: bool = False):
+        """
+        Turns `function(address, connection, record)` into a receive (or response) handler of messages of this
+        schema. Works with framed connections and `sttcp.router.Router` routes.
+        :param response: Schema of records returned by the function, they are sent back with `send_message`.
+        Without it the return value of the function is returned as it is, like `response_handler` of the client or
+        `sttcp.pipeline.responder` expect
+        :param many: Messages are lists of records packed with `pack_many` and so are the responses
+        """
+        unpack = self.unpack_many if many else self.unpack
+        pack = None if response is None else response.pack_many if many else response.pack
+
+        def receive_handler(addr, connection, data):
+            result = function(addr, connection, unpack(data))
+            if pack is None:
+                return result
+            if result is not None:
+                connection.send_message(pack(result))
+            return None
+
+        receive_handler.__wrapped__ = function
+        return receive_handler
+
+    def __repr__(self):
+        fields = ', '.join(f'{field}: {kind}' for field, kind in self.fields)
+        return f'Schema({self.name}; {fields})'
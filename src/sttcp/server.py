@@ -1,18 +1,45 @@
+import selectors
 import socket
 import threading
+import time
 import traceback
 import warnings
-import time
 from enum import Enum
 from typing import Union
 try:
-    from . import connections, print_sync
+    from . import connections, connections_lock, logger
+    from .workers import WorkerPool, PoolOverflowError
+    from .connection import Connection
+    from .framing import FrameTooLargeError, LengthPrefixFramer
+    from .metrics import Metrics
+    from .registry import Registry
+    from .timeouts import IdleWatch, KeepAlive
+    from .transport import Transport, detect, format_address
+    from .options import SocketOptions
+    from . import handoff
+    from .admission import AdmissionControl, RateLimitError
+    from .router import Router
+    from .compression import Compression, check_framer
+    from .replay import Recorder
 except ImportError:
-    from sttcp import connections, print_sync
+    from sttcp import connections, connections_lock, logger
+    from sttcp.workers import WorkerPool, PoolOverflowError
+    from sttcp.connection import Connection
+    from sttcp.framing import FrameTooLargeError, LengthPrefixFramer
+    from sttcp.metrics import Metrics
+    from sttcp.registry import Registry
+    from sttcp.timeouts import IdleWatch, KeepAlive
+    from sttcp.transport import Transport, detect, format_address
+    from sttcp.options import SocketOptions
+    from sttcp import handoff
+    from sttcp.admission import AdmissionControl, RateLimitError
+    from sttcp.router import Router
+    from sttcp.compression import Compression, check_framer
+    from sttcp.replay import Recorder
 
 
 def _default_connection(addr: tuple, connection: socket.socket) -> Union[bool, None]:
-    print_sync(f'Connected by {":".join(map(str, addr))}')
+    logger.info(f'Connected by {format_address(addr)}')
     return None
 
 
@@ -21,7 +48,7 @@ def _default_receive(addr: tuple, connection: socket.socket, data: bytes):
 
 
 def _default_disconnection(addr: tuple, disconnection_reason: Exception):
-    print_sync(f'Disconnected by {":".join(map(str, addr))}')
+    logger.info(f'Disconnected by {format_address(addr)}')
 
 
 def _default_universal(handler_type, addr: tuple, connection: Union[socket.socket, None], data: Union[bytes, None]):
@@ -34,10 +61,44 @@ class Server:
         receive = 2
         disconnection = 3
 
-    def __init__(self, host: str, port: Union[str, int], handler=None):
+    def __init__(self, host: str, port: Union[str, int, None], handler=None,
+                 workers: Union[int, WorkerPool, None] = None, framer=None, buffer_size: int = 1024,
+                 zero_copy: bool = False, metrics: Union[bool, Metrics] = False,
+                 sock: Union[socket.socket, None] = None, writer=None, idle_timeout: Union[float, None] = None,
+                 keepalive: Union[bool, KeepAlive] = False,
+                 transport: Union[Transport, None] = None, socket_options: Union[bool, SocketOptions] = False,
+                 admission: Union[AdmissionControl, None] = None, router: Union[Router, None] = None,
+                 compression: Union[bool, Compression] = False, recorder: Union[Recorder, None] = None):
         """
         Represents server TCP connection. Add handler using @server.add_handler decorator or server.set_handler(handler)
         function.
+        :param workers: Run connections on a bounded `sttcp.workers.WorkerPool` (or a pool of that many threads)
+        instead of starting a new thread for every client
+        :param framer: Factory of `sttcp.framing.Framer` (like `LengthPrefixFramer`) to deliver whole messages to
+        `receive_handler` instead of raw chunks. Handlers get `sttcp.connection.Connection` with `send_message` method
+        :param buffer_size: Maximum size of one received chunk
+        :param zero_copy: Receive into one preallocated buffer per connection using `recv_into`. Handlers get
+        `memoryview` slices of it instead of `bytes`, which are valid only until the handler returns
+        :param metrics: Collect `sttcp.metrics.Metrics` (pass True or an existing instance), read them with
+        `server.metrics.snapshot()`. Handlers get `sttcp.connection.Connection` with per-connection counters
+        :param sock: Already bound socket to listen on instead of binding a new one to `host` and `port`
+        :param writer: Factory of `sttcp.writer.Writer` (like `Writer` or
+        `functools.partial(Writer, high_watermark=...)`) called with the socket. `sendall` of handler connections then
+        queues data which is sent in background
+        :param idle_timeout: Close connections which didn't receive anything for this amount of seconds.
+        `disconnection_handler` gets `sttcp.timeouts.IdleTimeoutError` as the reason
+        :param keepalive: Enable TCP keepalive, pass `sttcp.timeouts.KeepAlive` to configure probes
+        :param transport: `sttcp.transport.TCP`, `TCP6`, `Unix` or `Loopback`. By default `Unix` if `port` is None
+        (then `host` is a socket path), `TCP6` if `host` is an IPv6 address and `TCP` otherwise
+        :param socket_options: `sttcp.options.SocketOptions` of listening and accepted sockets. True uses defaults:
+        `TCP_NODELAY`, `SO_REUSEADDR` and `SOMAXCONN` backlog
+        :param admission: `sttcp.admission.AdmissionControl` with connection limits and per-peer rate limits. Rejected
+        connections are closed before any handler runs
+        :param router: `sttcp.router.Router` which dispatches framed messages by opcode, see `server.route`
+        :param compression: `sttcp.compression.Compression` of messages (True uses zlib), negotiated with every client
+        which has compression enabled. Uses `LengthPrefixFramer` if `framer` isn't set, other framers raise `ValueError`
+        :param recorder: `sttcp.replay.Recorder` which saves received bytes of every connection with their timing.
+        It is closed when the server and its last connection are closed
         """
         self._connection_handler = _default_connection
         self._receive_handler = _default_receive
@@ -47,28 +108,98 @@ class Server:
         self.handler = handler
         self.host = host
         self.port = port
-        self.address = str(self.host) + ':' + str(self.port)
-        self.sock_name = (self.host, self.port)
+        self.transport = transport or detect(host, port)
+        self.sock_name = self.transport.address(self.host, self.port)
+        self.address = format_address(self.sock_name)
 
         self.is_listening = False
 
-        def conn_handler(addr, conn: socket.socket):
+        self._owns_pool = isinstance(workers, int)
+        self.pool = WorkerPool(workers) if self._owns_pool else workers
+        self.compression = Compression() if compression is True else compression or None
+        self.framer = LengthPrefixFramer if self.compression is not None and framer is None else framer
+        if self.compression is not None:
+            check_framer(self.framer)
+        self.buffer_size = buffer_size
+        self.zero_copy = zero_copy
+        self.metrics = Metrics() if metrics is True else metrics or None
+        self._listener = sock
+        self.writer = writer
+        self.clients = Registry()
+        self.idle_timeout = idle_timeout
+        self.keepalive = KeepAlive() if keepalive is True else keepalive or None
+        self.socket_options = SocketOptions() if socket_options is True else socket_options or None
+        self.admission = admission
+        self.router = router
+        self.recorder = recorder
+        self._dispatch = None
+
+        def conn_handler(addr, conn: Union[socket.socket, Connection], client_id: int):
             with conn:
+                metrics = self.metrics
+                if metrics is not None:
+                    metrics.connection_opened()
+                recorder = self.recorder
+                if recorder is not None:
+                    recorder.opened(client_id)
+                wrapped = isinstance(conn, Connection)
+                buffer = memoryview(bytearray(self.buffer_size)) if self.zero_copy else None
+                watch = None if self.idle_timeout is None else IdleWatch(conn, self.idle_timeout)
+                limit_messages = self.admission is not None and self.admission.messages_per_second is not None
+                if wrapped:
+                    conn.watch = watch
                 disconnection_reason = None
                 while True:
                     try:
-                        data = conn.recv(1024)
+                        if buffer is None:
+                            data = conn.recv(self.buffer_size)
+                        else:
+                            data = buffer[:conn.recv_into(buffer)]
                     except OSError:
                         data = b''
 
                     if not data:
+                        if watch is not None and watch.expired:
+                            disconnection_reason = watch.error()
+                        elif self._forced:
+                            disconnection_reason = ConnectionAbortedError('Server was drained')
                         break
 
+                    if watch is not None:
+                        watch.touch()
+                    if recorder is not None:
+                        recorder.received(client_id, data)
+
+                    messages = conn.receive(data) if wrapped else (data,)
+
+                    if self.admission is not None:
+                        delay = self.admission.limit(addr, len(data), 0)
+                        if delay < 0:
+                            disconnection_reason = RateLimitError('Rate limit exceeded')
+                            break
+                        if delay:
+                            time.sleep(delay)
+
+                    started = time.perf_counter() if metrics is not None else 0.0
+                    count = 0
+                    throttled = 0.0
                     try:
-                        self._universal_handler(self.HandlerType.receive, addr, conn, data)
-                        self._receive_handler(addr, conn, data)
-                        if self.handler is not None:
-                            self.handler(addr, conn, data)
+                        dispatch = self._dispatch
+                        for data in messages:
+                            count += 1
+                            if limit_messages:
+                                delay = self.admission.limit(addr, 0, 1)
+                                if delay < 0:
+                                    raise RateLimitError('Rate limit exceeded')
+                                if delay:
+                                    # Throttling isn't handler latency, it is left out of the receive timing
+                                    time.sleep(delay)
+                                    throttled += delay
+                            if dispatch is not None:
+                                dispatch(addr, conn, data)
+                    except FrameTooLargeError as e:
+                        disconnection_reason = e
+                        break
                     except (ConnectionResetError, ConnectionRefusedError, ConnectionAbortedError,
                             ConnectionError, OSError) as e:
                         disconnection_reason = e
@@ -78,11 +209,27 @@ class Server:
                                    'problems:\033[0m')
                         message += '\n' + traceback.format_exc()
                         message += '\n' + '\033[91mDisconnecting the client\033[0m'
-                        print_sync(message)
+                        logger.error(message)
+                        if metrics is not None:
+                            metrics.handled(self.HandlerType.receive, time.perf_counter() - started - throttled,
+                                            count, error=True)
                         disconnection_reason = e
                         conn.close()
                         break
-
+                    if metrics is not None:
+                        metrics.handled(self.HandlerType.receive, time.perf_counter() - started - throttled, count)
+
+                if watch is not None:
+                    watch.cancel()
+                if recorder is not None:
+                    recorder.closed(client_id)
+                self.clients.remove(client_id)
+                if recorder is not None and self.closed and not len(self.clients):
+                    recorder.close()
+                if self.admission is not None:
+                    self.admission.release(addr)
+
+                started = time.perf_counter() if metrics is not None else 0.0
                 try:
                     self._universal_handler(self.HandlerType.disconnection, addr, None, None)
                     self._disconnection_handler(addr, disconnection_reason)
@@ -90,71 +237,295 @@ class Server:
                     message = ('\033[91mOh no! Something went wrong in your handler! Check it out and find '
                                'problems:\033[0m')
                     message += '\n' + traceback.format_exc()
-                    print_sync(message)
+                    logger.error(message)
+                if metrics is not None:
+                    metrics.handled(self.HandlerType.disconnection, time.perf_counter() - started, 0)
+                    metrics.connection_closed()
 
-        def server():
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s = self._socket
-            s.bind(self.sock_name)
-            self.sock_name = s.getsockname()
-            s.listen()
+        def cancelled() -> bool:
+            return self._socket_thread.shutdown
 
-            print_sync(f'Listening to {":".join(map(str, s.getsockname()))}')
-
-            self.is_listening = True
-            while not self._socket_thread.shutdown:
-                try:
-                    conn, addr = s.accept()
-                    if addr != self._socket_thread.shutdown_socket:
+        def discard(addr, conn, client_id: int):
+            self.clients.remove(client_id)
+            if self.admission is not None:
+                self.admission.release(addr)
+            conn.close()
 
+        def server():
+            if self._listener is None:
+                self._socket = self.transport.create_listening_socket()
+            else:
+                self._socket = self._listener
+            s = self._socket
+            try:
+                if self._listener is None:
+                    if self.socket_options is not None:
+                        self.socket_options.apply_listening(s, self.transport.tcp)
+                    self.transport.bind(s, self.sock_name)
+                self.sock_name = s.getsockname()
+                if self.socket_options is not None:
+                    self.socket_options.listen(s)
+                else:
+                    s.listen()
+            except OSError:
+                s.close()
+                finish()
+                raise
+
+            selector = selectors.DefaultSelector()
+            try:
+                s.setblocking(False)
+                selector.register(s, selectors.EVENT_READ)
+                selector.register(self._wakeup_receiver, selectors.EVENT_READ)
+
+                logger.info(f'Listening to {format_address(self.sock_name)}')
+
+                self.is_listening = True
+                self._listening_event.set()
+                while not self._socket_thread.shutdown:
+                    selector.select()
+                    try:
+                        conn, addr = s.accept()
+                        addr = self.transport.peer_address(conn, addr)
+                        if self.admission is not None and \
+                                not self.admission.admit(addr, self.pool is not None and self.pool.saturated):
+                            conn.close()
+                            if self.metrics is not None:
+                                self.metrics.increment('shed')
+                            continue
+                        conn.setblocking(True)
+                        if self.socket_options is not None:
+                            self.socket_options.apply(conn, self.transport.tcp)
+                        if self.keepalive is not None and self.transport.tcp:
+                            self.keepalive.apply(conn)
+                        if self.framer is not None or self.metrics is not None or self.writer is not None:
+                            framer = None if self.framer is None else self.framer()
+                            conn = Connection(conn, framer, self.metrics,
+                                              None if self.writer is None else self.writer(conn),
+                                              None if self.compression is None else
+                                              self.compression.session(False, framer.max_size))
+
+                        client_id = self.clients.add(addr, conn)
+
+                        started = time.perf_counter() if self.metrics is not None else 0.0
                         try:
                             connect_alt = self._universal_handler(self.HandlerType.connection, addr, None, None)
                             connect = self._connection_handler(addr, conn)
                         except (ConnectionResetError, ConnectionRefusedError, ConnectionAbortedError,
                                 ConnectionError, OSError):
+                            discard(addr, conn, client_id)
+                            continue
+                        except Exception:
+                            message = ('\033[91mOh no! Something went wrong in your handler! Check it out and '
+                                       'find problems:\033[0m')
+                            message += '\n' + traceback.format_exc()
+                            message += '\n' + '\033[91mDisconnecting the client\033[0m'
+                            logger.error(message)
+                            discard(addr, conn, client_id)
                             continue
 
                         if connect is None:
                             connect = connect_alt or True
 
+                        if self.metrics is not None:
+                            self.metrics.handled(self.HandlerType.connection, time.perf_counter() - started, 0)
+                            if not connect:
+                                self.metrics.increment('rejected')
+
                         if connect:
-                            conn_thread = threading.Thread(target=conn_handler, args=(addr, conn))
-                            conn_thread.start()
+                            if self.pool is None:
+                                conn_thread = threading.Thread(target=conn_handler, args=(addr, conn, client_id))
+                                conn_thread.start()
+                            elif not self.pool.submit(conn_handler, addr, conn, client_id, cancelled=cancelled):
+                                discard(addr, conn, client_id)
+                                if self.metrics is not None:
+                                    self.metrics.increment('rejected')
+                                reason = ConnectionAbortedError('Server closed') if self._socket_thread.shutdown \
+                                    else PoolOverflowError('Worker pool is full')
+                                try:
+                                    self._universal_handler(self.HandlerType.disconnection, addr, None, None)
+                                    self._disconnection_handler(addr, reason)
+                                except Exception:
+                                    message = ('\033[91mOh no! Something went wrong in your handler! Check it out '
+                                               'and find problems:\033[0m')
+                                    message += '\n' + traceback.format_exc()
+                                    logger.error(message)
                         else:
-                            conn.close()
-                except OSError:
-                    break
+                            discard(addr, conn, client_id)
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        break
 
-            print_sync(f'Stopped server {":".join(map(str, self.sock_name))}')
+            finally:
+                logger.info(f'Stopped server {format_address(self.sock_name)}')
 
-            s.close()
+                selector.close()
+                s.close()
+                if self._listener is None and not self._handed_off:
+                    self.transport.cleanup(self.sock_name)
+                if self._owns_pool:
+                    self.pool.shutdown()
+                finish()
+
+        def finish():
+            self._wakeup_receiver.close()
+            self._wakeup_sender.close()
             self.closed = True
-            connections.remove(self)
+            # The last connection closes the recorder if some are still open
+            if self.recorder is not None and not len(self.clients):
+                self.recorder.close()
+            with connections_lock:
+                connections.remove(self)
+            self._listening_event.set()
+            self._closed_event.set()
 
         self._socket_thread = threading.Thread(target=server, daemon=True)
         self._socket_thread.shutdown = False
-        self._socket_thread.shutdown_socket = None
+        self._wakeup_receiver, self._wakeup_sender = socket.socketpair()
+        self._listening_event = threading.Event()
+        self._closed_event = threading.Event()
         self.closed = False
+        self._handed_off = False
+        self._forced = False
+
+    def _compile(self) -> None:
+        """Builds the function called for every received message once, leaving out handlers which are not set"""
+        chain = []
+        if self._universal_handler is not _default_universal:
+            universal = self._universal_handler
+            handler_type = self.HandlerType.receive
+            chain.append(lambda addr, conn, data: universal(handler_type, addr, conn, data))
+        if self._receive_handler is not _default_receive:
+            chain.append(self._receive_handler)
+        if self.router is not None:
+            chain.append(self.router)
+        if self.handler is not None:
+            chain.append(self.handler)
+
+        if len(chain) > 1:
+            handlers = tuple(chain)
+
+            def dispatch(addr, conn, data):
+                for function in handlers:
+                    function(addr, conn, data)
+            self._dispatch = dispatch
+        else:
+            self._dispatch = chain[0] if chain else None
 
     def start(self):
         """Starts TCP server"""
+        self._compile()
+        with connections_lock:
+            connections.append(self)
         self._socket_thread.start()
-        connections.append(self)
 
     def close(self):
-        """Closes TCP server"""
+        """Closes TCP server. Returns immediately, use `wait_closed` to wait until the server is stopped"""
         self._socket_thread.shutdown = True
         try:
-            closure_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            closure_socket.connect((self.host, self.port))
-            self._socket_thread.shutdown_socket = closure_socket.getsockname()
-        except (ConnectionResetError, ConnectionRefusedError, ConnectionAbortedError, ConnectionError, OSError) as e:
-            raise e
+            self._wakeup_sender.send(b'\0')
+        except OSError:
+            pass
+        if self.pool is not None:
+            self.pool.wake()
+
+    def wait_listening(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Blocks until the server is listening.
+        :return: False if timeout expired or the server couldn't start listening
+        """
+        self._listening_event.wait(timeout)
+        return self.is_listening
+
+    def wait_closed(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Blocks until the server is stopped.
+        :return: False if timeout expired
+        """
+        return self._closed_event.wait(timeout)
 
     def stop(self):
         """Alternative of .close()"""
         self.close()
 
+    def drain(self, timeout: Union[float, None] = 30.0) -> bool:
+        """
+        Stops accepting new connections and waits until connected clients finish. Clients still connected after
+        `timeout` (which also covers stopping the accept thread) are disconnected with `ConnectionAbortedError` reason.
+        :return: False if some clients were disconnected by force
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.close()
+        if self.wait_closed(timeout) and \
+                self.clients.wait_empty(None if deadline is None else max(0.0, deadline - time.monotonic())):
+            return True
+
+        logger.warning(f'Disconnecting {len(self.clients)} clients of {format_address(self.sock_name)}')
+        self._forced = True
+        for connection in self.clients:
+            try:
+                getattr(connection, 'socket', connection).shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.clients.wait_empty(5.0)
+        return False
+
+    def handoff(self, path: str, timeout: Union[float, None] = 10.0) -> None:
+        """
+        Sends the listening socket to a successor process waiting in `sttcp.handoff.receive_socket(path)`, so it
+        accepts connections on the same socket without refusing any. Call `drain` afterwards.
+        """
+        if not self.wait_listening(timeout):
+            raise ConnectionError('Server is not listening')
+        handoff.send_socket(self._socket, path, timeout)
+        self._handed_off = True
+
+    def spawn_successor(self, args: Union[list, None] = None, **popen):
+        """
+        Starts a successor process (the current command line by default) which inherits the listening socket and gets
+        it with `sttcp.handoff.inherited_socket()`. Call `drain` when the successor is ready.
+        :return: `subprocess.Popen` of the successor
+        """
+        if not self.wait_listening():
+            raise ConnectionError('Server is not listening')
+        process = handoff.spawn_successor(self._socket, args, **popen)
+        self._handed_off = True
+        return process
+
+    def broadcast(self, data: bytes, group: Union[str, None] = None, exclude=None, message: bool = False) -> int:
+        """
+        Sends the same data to every connected client (or to every client of `group`, see `server.clients.join`)
+        without waiting for slow clients. See `sttcp.registry.Registry.broadcast`.
+        :param exclude: ID, address or connection which doesn't receive data
+        :param message: Frame data once using server framer before sending. With compression every client gets it
+        through its own `send_message` instead, which waits for slow clients without a `writer`
+        :return: Amount of clients data was queued to
+        """
+        if message and self.compression is not None:
+            members = None if group is None else set(map(id, self.clients.members(group)))
+            delivered = 0
+            for client_id, address, connection in self.clients.items():
+                if exclude is not None and exclude in (client_id, address, connection):
+                    continue
+                if members is not None and id(connection) not in members:
+                    continue
+                try:
+                    connection.send_message(data)
+                    delivered += 1
+                except OSError:
+                    pass
+            return delivered
+        if message and self.framer is not None:
+            data = self.framer().frame(data)
+        return self.clients.broadcast(data, group, exclude)
+
+    def pool_stats(self) -> Union[dict, None]:
+        """Returns worker pool usage snapshot (see `sttcp.workers.WorkerPool.stats`) or None without a pool"""
+        if self.pool is None:
+            return None
+        return self.pool.stats()
+
     def set_handler(self, function):
         """
         Sets a handler for TCP server. Handler format:
@@ -162,6 +533,7 @@ class Server:
         def server_handler(addr: tuple, conn: socket.socket, data: bytes): pass
         """
         self.handler = function
+        self._compile()
         warnings.warn('This method is deprecated', DeprecationWarning)
 
     def connection_handler(self, function) -> None:
@@ -178,6 +550,7 @@ class Server:
         `"data: bytes"` parameters`
         """
         self._receive_handler = function
+        self._compile()
 
     def disconnection_handler(self, function) -> None:
         """
@@ -186,6 +559,21 @@ class Server:
         """
         self._disconnection_handler = function
 
+    def route(self, opcode: int):
+        """
+        Decorator which registers a handler of framed messages starting with `opcode`. Handler gets `"address: tuple"`,
+        `"connection: sttcp.connection.Connection"` and `"payload: bytes"` (message without opcode) parameters.
+        Uses one byte opcodes unless `router` parameter is set. See `sttcp.router.Router`
+        """
+        if self.router is None:
+            self.router = Router()
+
+        def decorator(function):
+            self.router.add(opcode, function)
+            self._compile()
+            return function
+        return decorator
+
     def universal_handler(self, function) -> None:
         """
         Sets a universal handler for TCP server.
@@ -193,25 +581,22 @@ class Server:
         `"address: tuple"`, `"connection: Union[socket.socket, None]"`, `"data: Union[bytes, None]"` parameters`
         """
         self._universal_handler = function
+        self._compile()
 
     def keep_alive(self):
         """Use it to make server stoppable only by KeyboardInterrupt exception."""
         try:
-            while not self.is_listening:
-                pass
-
-            print_sync('Press Ctrl + C to stop server!')
+            if self.wait_listening():
+                logger.info('Press Ctrl + C to stop server!')
 
-            while self._socket_thread.is_alive():
-                self._socket_thread.join(0.1)
+            self.wait_closed()
         except KeyboardInterrupt:
             if hasattr(self, '_socket'):
 
-                print_sync('Stopping server...')
+                logger.info('Stopping server...')
 
                 self.close()
-                while not self.closed:
-                    time.sleep(0.1)
+                self.wait_closed()
 
     def mainloop(self):
         warnings.warn('This method was renamed to keep_alive', DeprecationWarning)
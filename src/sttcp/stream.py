@@ -0,0 +1,90 @@
+import os
+import socket
+from typing import Iterator, Union
+
+CHUNK_SIZE = 256 * 1024
+
+
+def send_file(sock: socket.socket, file, offset: int = 0, count: Union[int, None] = None) -> int:
+    """
+    Sends a file opened in binary mode. Uses `os.sendfile`, so the data is copied by the kernel without passing
+    through Python memory (falls back to `send` where it isn't available).
+    :param offset: Position in the file to start from
+    :param count: Amount of bytes to send, the rest of the file by default
+    :return: Amount of sent bytes
+    """
+    if count == 0:
+        return 0
+    return sock.sendfile(file, offset, count)
+
+
+def send_buffer(sock: socket.socket, data: Union[bytes, bytearray, memoryview], chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Sends a large buffer in `chunk_size` slices of a `memoryview` without copying it.
+    :return: Amount of sent bytes
+    """
+    view = memoryview(data).cast('B')
+    for start in range(0, len(view), chunk_size):
+        sock.sendall(view[start:start + chunk_size])
+    return len(view)
+
+
+def send_iterable(sock: socket.socket, chunks) -> int:
+    """
+    Sends every chunk of an iterable (like a generator producing data), so the whole payload is never in memory.
+    :return: Amount of sent bytes
+    """
+    sent = 0
+    for chunk in chunks:
+        sock.sendall(chunk)
+        sent += len(chunk)
+    return sent
+
+
+def send_stream(sock: socket.socket, data, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Sends a large buffer with `send_buffer` or an iterable with `send_iterable`.
+    :return: Amount of sent bytes
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return send_buffer(sock, data, chunk_size)
+    return send_iterable(sock, data)
+
+
+def iter_recv(sock: socket.socket, size: int, chunk_size: int = CHUNK_SIZE, initial: bytes = b'') \
+        -> Iterator[memoryview]:
+    """
+    Receives exactly `size` bytes as chunks. Chunks are `memoryview` slices of one reusable buffer, valid only until
+    the next chunk is requested.
+    :param initial: Bytes of the stream which were already received (like the rest of the chunk after a header)
+    """
+    if initial:
+        initial = memoryview(initial)[:size]
+        size -= len(initial)
+        yield initial
+
+    buffer = memoryview(bytearray(min(chunk_size, size) or 1))
+    while size > 0:
+        received = sock.recv_into(buffer, min(len(buffer), size))
+        if not received:
+            raise ConnectionResetError(f'Connection closed with {size} bytes of the stream left')
+        size -= received
+        yield buffer[:received]
+
+
+def recv_to_file(sock: socket.socket, file, size: int, chunk_size: int = CHUNK_SIZE, initial: bytes = b'') -> int:
+    """
+    Receives exactly `size` bytes into a file opened in binary mode, using constant memory.
+    :param initial: Bytes of the stream which were already received
+    :return: Amount of received bytes
+    """
+    received = 0
+    for chunk in iter_recv(sock, size, chunk_size, initial):
+        file.write(chunk)
+        received += len(chunk)
+    return received
+
+
+def file_size(file) -> int:
+    """Returns amount of bytes left in a file from its current position"""
+    return os.fstat(file.fileno()).st_size - file.tell()
@@ -0,0 +1,152 @@
+import os
+import socket
+import threading
+import time
+from typing import Union
+try:
+    from . import logger
+except ImportError:
+    from sttcp import logger
+
+
+class IdleTimeoutError(TimeoutError):
+    """Passed to `disconnection_handler` when connection was closed because nothing was received for too long."""
+    pass
+
+
+class KeepAlive:
+    def __init__(self, idle: Union[int, None] = 60, interval: Union[int, None] = 10, count: Union[int, None] = 5):
+        """
+        TCP keepalive options. Options unsupported by the platform are skipped.
+        :param idle: Seconds of inactivity before the first probe (`TCP_KEEPIDLE`)
+        :param interval: Seconds between probes (`TCP_KEEPINTVL`)
+        :param count: Amount of unanswered probes before the connection is dropped (`TCP_KEEPCNT`)
+        """
+        self.idle = idle
+        self.interval = interval
+        self.count = count
+
+    def apply(self, sock: socket.socket) -> None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        idle_option = getattr(socket, 'TCP_KEEPIDLE', getattr(socket, 'TCP_KEEPALIVE', None))
+        for option, value in ((idle_option, self.idle),
+                              (getattr(socket, 'TCP_KEEPINTVL', None), self.interval),
+                              (getattr(socket, 'TCP_KEEPCNT', None), self.count)):
+            if option is not None and value is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, option, value)
+
+
+class Timer:
+    __slots__ = ('callback', 'rounds', 'cancelled')
+
+    def __init__(self, callback, rounds: int):
+        self.callback = callback
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+        self.callback = None
+
+
+class TimerWheel:
+    def __init__(self, tick: float = 0.5, slots: int = 512):
+        """
+        Hashed timer wheel. Scheduling and cancelling are O(1) and one background thread serves every timer, so it
+        is cheap to keep a timer for each connection. Timers fire with `tick` precision.
+        """
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._position = 0
+        self._next_tick = 0.0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def schedule(self, delay: float, callback) -> Timer:
+        """Calls `callback()` after `delay` seconds. Returns `Timer` which can be cancelled"""
+        with self._lock:
+            if self._thread is None:
+                self._next_tick = time.monotonic() + self.tick
+                self._thread = threading.Thread(target=self._run, name='sttcp-timers', daemon=True)
+                self._thread.start()
+            # The next slot fires at `_next_tick`, which may be less than one tick away
+            ticks = max(1, 1 + int(-(-(time.monotonic() + delay - self._next_tick) // self.tick)))
+            timer = Timer(callback, (ticks - 1) // len(self._slots))
+            self._slots[(self._position + ticks) % len(self._slots)].append(timer)
+        return timer
+
+    def _reset(self):
+        self._slots = [[] for _ in self._slots]
+        self._position = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            delay = self._next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            with self._lock:
+                self._next_tick += self.tick
+                self._position = (self._position + 1) % len(self._slots)
+                slot = self._slots[self._position]
+                expired = [timer for timer in slot if not timer.cancelled and not timer.rounds]
+                kept = []
+                for timer in slot:
+                    if timer.cancelled or not timer.rounds:
+                        continue
+                    timer.rounds -= 1
+                    kept.append(timer)
+                self._slots[self._position] = kept
+
+            for timer in expired:
+                callback = timer.callback
+                if callback is None:
+                    continue
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f'Timer callback {callback!r} failed: {e!r}')
+
+
+wheel = TimerWheel()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=wheel._reset)
+
+
+class IdleWatch:
+    def __init__(self, sock, timeout: float, timer_wheel: TimerWheel = None):
+        """
+        Shuts `sock` down when `touch()` wasn't called for `timeout` seconds. Then `expired` is True.
+        """
+        self.socket = sock
+        self.timeout = timeout
+        self.wheel = timer_wheel or wheel
+        self.expired = False
+        self.last = time.monotonic()
+        self._cancelled = False
+        self._timer = self.wheel.schedule(timeout, self._check)
+
+    def touch(self) -> None:
+        self.last = time.monotonic()
+
+    def _check(self):
+        if self._cancelled:
+            return
+        left = self.last + self.timeout - time.monotonic()
+        if left > 0:
+            self._timer = self.wheel.schedule(left, self._check)
+            return
+        self.expired = True
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def error(self) -> IdleTimeoutError:
+        return IdleTimeoutError(f'Nothing was received for {self.timeout} seconds')
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        self._timer.cancel()
@@ -0,0 +1,226 @@
+import itertools
+import os
+import socket
+import stat
+import threading
+import weakref
+from collections import deque
+from typing import Union
+
+
+def format_address(addr) -> str:
+    """Returns printable form of a socket address: `host:port`, `[host]:port`, unix path or `@abstract-name`"""
+    if isinstance(addr, bytes):
+        addr = addr.decode('utf-8', 'replace')
+    if isinstance(addr, str):
+        if addr.startswith('\0'):
+            return '@' + addr[1:]
+        return addr or 'unix'
+    if len(addr) == 4 or ':' in str(addr[0]):
+        return f'[{addr[0]}]:{addr[1]}'
+    return ':'.join(map(str, addr))
+
+
+class Transport:
+    family = socket.AF_INET
+    tcp = True
+
+    def address(self, host: str, port: Union[str, int, None]):
+        """Returns socket address for `bind` and `connect`"""
+        return host, port
+
+    def create_socket(self) -> socket.socket:
+        return socket.socket(self.family, socket.SOCK_STREAM)
+
+    def create_listening_socket(self):
+        return self.create_socket()
+
+    def bind(self, sock: socket.socket, address) -> None:
+        sock.bind(address)
+
+    def connect(self, sock: socket.socket, address) -> None:
+        sock.connect(address)
+
+    def peer_address(self, conn: socket.socket, addr):
+        """Returns address passed to handlers for an accepted connection"""
+        return addr
+
+    def cleanup(self, address) -> None:
+        """Called after a listening socket bound by the server is closed"""
+        pass
+
+    def __repr__(self):
+        return f'{type(self).__name__}()'
+
+
+class TCP(Transport):
+    """IPv4 TCP, `(host, port)` addresses."""
+    pass
+
+
+class TCP6(Transport):
+    family = socket.AF_INET6
+
+    def __init__(self, dual_stack: bool = True):
+        """
+        IPv6 TCP, `(host, port)` addresses like `('::1', 8080)`.
+        :param dual_stack: Listening sockets also accept IPv4 clients (as `::ffff:a.b.c.d` addresses)
+        """
+        self.dual_stack = dual_stack
+
+    def create_socket(self) -> socket.socket:
+        s = socket.socket(self.family, socket.SOCK_STREAM)
+        if hasattr(socket, 'IPV6_V6ONLY'):
+            s.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0 if self.dual_stack else 1)
+        return s
+
+    def __repr__(self):
+        return f'TCP6(dual_stack={self.dual_stack})'
+
+
+class Unix(Transport):
+    family = getattr(socket, 'AF_UNIX', None)
+    tcp = False
+
+    def __init__(self, unlink: bool = True):
+        """
+        Unix domain stream socket. Local clients skip the TCP stack, which gives lower latency and higher throughput.
+        `host` is a path and `port` is None. Names starting with `@` (or `\\0`) are in the Linux abstract namespace and
+        don't create files. Handlers get the path of the client socket or `('unix', fileno)` for unnamed clients.
+        :param unlink: Remove a stale socket file before binding and after closing
+        """
+        if self.family is None:
+            raise OSError('Unix domain sockets are not supported on this platform')
+        self.unlink = unlink
+
+    def address(self, host: str, port: Union[str, int, None] = None) -> str:
+        if host.startswith('@'):
+            return '\0' + host[1:]
+        return host
+
+    def bind(self, sock: socket.socket, address) -> None:
+        if self.unlink and self._is_file(address):
+            try:
+                if stat.S_ISSOCK(os.stat(address).st_mode):
+                    os.unlink(address)
+            except FileNotFoundError:
+                pass
+        sock.bind(address)
+
+    def peer_address(self, conn: socket.socket, addr):
+        return addr or ('unix', conn.fileno())
+
+    def cleanup(self, address) -> None:
+        if self.unlink and self._is_file(address):
+            try:
+                os.unlink(address)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _is_file(address) -> bool:
+        return isinstance(address, str) and bool(address) and not address.startswith('\0')
+
+    def __repr__(self):
+        return f'Unix(unlink={self.unlink})'
+
+
+class _Listener:
+    """Listening socket of `Loopback`. Accepts sockets queued by `Loopback.connect`, readable while any is queued"""
+
+    def __init__(self, transport: 'Loopback'):
+        self._transport = transport
+        self._queue = deque()
+        self._receiver, self._sender = socket.socketpair()
+        self._receiver.setblocking(False)
+        self.address = None
+
+    def fileno(self) -> int:
+        return self._receiver.fileno()
+
+    def setsockopt(self, *args) -> None:
+        pass
+
+    def setblocking(self, flag: bool) -> None:
+        pass
+
+    def listen(self, backlog: Union[int, None] = None) -> None:
+        pass
+
+    def getsockname(self):
+        return self.address
+
+    def push(self, conn: socket.socket) -> None:
+        self._queue.append(conn)
+        self._sender.send(b'\0')
+
+    def accept(self):
+        self._receiver.recv(1)
+        return self._queue.popleft(), ('loopback', next(self._transport.peers))
+
+    def close(self) -> None:
+        self._transport.unregister(self)
+        self._receiver.close()
+        self._sender.close()
+        while self._queue:
+            self._queue.popleft().close()
+
+
+class Loopback(Transport):
+    family = getattr(socket, 'AF_UNIX', None)
+    tcp = False
+    _listeners = {}
+    _lock = threading.Lock()
+    _ports = itertools.count(49152)
+    peers = itertools.count(1)
+
+    def __init__(self):
+        """
+        In-process transport for tests and benchmarks of `sttcp.server.Server` and `sttcp.client.Client`. Connections
+        are `socket.socketpair()` sockets, so the same handlers run without binding ports. Addresses are
+        `(host, port)` names shared by all `Loopback` instances of the process, port 0 takes a free one.
+        Handlers get `('loopback', number)` addresses of clients.
+        """
+        self._peers = weakref.WeakKeyDictionary()
+
+    def create_socket(self) -> socket.socket:
+        sock, peer = socket.socketpair()
+        self._peers[sock] = peer
+        return sock
+
+    def create_listening_socket(self) -> _Listener:
+        return _Listener(self)
+
+    def bind(self, sock: _Listener, address) -> None:
+        host, port = address
+        with self._lock:
+            if not port:
+                port = next(port for port in self._ports if (host, port) not in self._listeners)
+            address = host, port
+            if address in self._listeners:
+                raise OSError(f'Loopback address {format_address(address)} is already in use')
+            self._listeners[address] = sock
+        sock.address = address
+
+    def connect(self, sock: socket.socket, address) -> None:
+        listener = self._listeners.get(tuple(address))
+        peer = self._peers.pop(sock, None)
+        if listener is None or peer is None:
+            if peer is not None:
+                peer.close()
+            raise ConnectionRefusedError(f'Nothing listens to loopback address {format_address(address)}')
+        listener.push(peer)
+
+    def unregister(self, listener: _Listener) -> None:
+        with self._lock:
+            if self._listeners.get(listener.address) is listener:
+                del self._listeners[listener.address]
+
+
+def detect(host: str, port: Union[str, int, None]) -> Transport:
+    """Chooses `Unix` when `port` is None, `TCP6` for IPv6 hosts and `TCP` otherwise"""
+    if port is None:
+        return Unix()
+    if isinstance(host, str) and ':' in host:
+        return TCP6()
+    return TCP()
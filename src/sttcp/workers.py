@@ -0,0 +1,184 @@
+import threading
+import traceback
+from collections import deque
+from enum import Enum
+try:
+    from . import logger
+except ImportError:
+    from sttcp import logger
+
+
+class PoolOverflowError(ConnectionRefusedError):
+    """Passed to `disconnection_handler` when a connection is rejected by a full worker pool."""
+    pass
+
+
+class OverflowPolicy(Enum):
+    reject = 1
+    block = 2
+    spawn = 3
+
+
+class WorkerPool:
+    def __init__(self, max_workers: int = 64, queue_size: int = 0, overflow: OverflowPolicy = OverflowPolicy.reject,
+                 name: str = 'sttcp-worker'):
+        """
+        Bounded pool of reusable worker threads. Threads are started lazily up to `max_workers` and wait for new tasks
+        after finishing the previous one instead of exiting.
+        :param max_workers: Maximum amount of worker threads
+        :param queue_size: Maximum amount of tasks waiting for a free worker
+        :param overflow: What to do when all workers are busy and the queue is full: `OverflowPolicy.reject` drops the
+        task, `OverflowPolicy.block` waits for a free slot, `OverflowPolicy.spawn` runs the task on a temporary thread
+        :param name: Prefix of worker thread names
+        """
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        if queue_size < 0:
+            raise ValueError('queue_size must not be negative')
+
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.name = name
+
+        self._tasks = deque()
+        self._condition = threading.Condition()
+        self._threads = set()
+        self._idle = 0
+        self._busy = 0
+        self._shutdown = False
+
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._spawned = 0
+
+    def _worker(self):
+        condition = self._condition
+        while True:
+            with condition:
+                while not self._tasks and not self._shutdown:
+                    self._idle += 1
+                    condition.wait()
+                    self._idle -= 1
+                if not self._tasks:
+                    self._threads.discard(threading.current_thread())
+                    return
+                function, args = self._tasks.popleft()
+                self._busy += 1
+                condition.notify_all()
+
+            try:
+                function(*args)
+            except Exception:
+                self._log_error()
+            finally:
+                with condition:
+                    self._busy -= 1
+                    self._completed += 1
+                    condition.notify_all()
+
+    @staticmethod
+    def _log_error():
+        message = '\033[91mOh no! Something went wrong in your handler! Check it out and find problems:\033[0m'
+        message += '\n' + traceback.format_exc()
+        logger.error(message)
+
+    def _run_spawned(self, function, args):
+        with self._condition:
+            self._busy += 1
+        try:
+            function(*args)
+        except Exception:
+            self._log_error()
+        finally:
+            with self._condition:
+                self._busy -= 1
+                self._completed += 1
+                self._condition.notify_all()
+
+    def submit(self, function, *args, cancelled=None) -> bool:
+        """
+        Runs `function(*args)` on a pool thread.
+        :param cancelled: Function returning True when a submit blocked by `OverflowPolicy.block` must give up. Call
+        `wake` after it starts returning True
+        :return: False if the task was rejected by the overflow policy, the pool is shut down or it was cancelled
+        """
+        with self._condition:
+            while True:
+                if self._shutdown or (cancelled is not None and cancelled()):
+                    self._rejected += 1
+                    return False
+
+                if self._idle > len(self._tasks) or len(self._tasks) < self.queue_size:
+                    self._tasks.append((function, args))
+                    self._submitted += 1
+                    self._condition.notify_all()
+                    return True
+
+                if len(self._threads) < self.max_workers:
+                    self._tasks.append((function, args))
+                    self._submitted += 1
+                    thread = threading.Thread(target=self._worker, name=f'{self.name}-{len(self._threads)}',
+                                              daemon=True)
+                    self._threads.add(thread)
+                    thread.start()
+                    return True
+
+                if self.overflow is OverflowPolicy.block:
+                    self._condition.wait()
+                    continue
+
+                if self.overflow is OverflowPolicy.spawn:
+                    self._submitted += 1
+                    self._spawned += 1
+                    threading.Thread(target=self._run_spawned, args=(function, args), daemon=True).start()
+                    return True
+
+                self._rejected += 1
+                return False
+
+    def wake(self) -> None:
+        """Wakes submits blocked by `OverflowPolicy.block`, so they check their `cancelled` function"""
+        with self._condition:
+            self._condition.notify_all()
+
+    @property
+    def saturated(self) -> bool:
+        """True if every worker is busy and no queue slot is free"""
+        with self._condition:
+            return (self._busy >= self.max_workers and self._idle <= len(self._tasks)
+                    and len(self._tasks) >= self.queue_size)
+
+    def stats(self) -> dict:
+        """Returns a snapshot of pool usage"""
+        with self._condition:
+            return {
+                'max_workers': self.max_workers,
+                'queue_size': self.queue_size,
+                'workers': len(self._threads),
+                'busy': self._busy,
+                'idle': self._idle,
+                'queued': len(self._tasks),
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'spawned': self._spawned,
+                'saturation': self._busy / self.max_workers,
+            }
+
+    def shutdown(self, wait: bool = False, timeout: float = None) -> None:
+        """
+        Stops accepting tasks. Already queued tasks are still executed.
+        :param wait: Wait for worker threads to finish
+        :param timeout: Maximum time to wait for each worker thread
+        """
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+            threads = list(self._threads)
+
+        if wait:
+            for thread in threads:
+                if thread is not threading.current_thread():
+                    thread.join(timeout)
@@ -0,0 +1,244 @@
+import os
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from typing import Union
+
+_IOV_MAX = 512
+_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+
+class WriterClosedError(ConnectionError):
+    """Raised when writing to a closed or failed `Writer`."""
+    pass
+
+
+class _Flusher:
+    def __init__(self):
+        """Background thread which sends queued data of every `Writer` when its socket is writable"""
+        self._lock = threading.Lock()
+        self._scheduled = set()
+        self._thread = None
+        self._selector = None
+        self._wakeup_receiver = self._wakeup_sender = None
+
+    def schedule(self, writer: 'Writer') -> None:
+        with self._lock:
+            if self._thread is None:
+                self._selector = selectors.DefaultSelector()
+                self._wakeup_receiver, self._wakeup_sender = socket.socketpair()
+                self._wakeup_receiver.setblocking(False)
+                self._selector.register(self._wakeup_receiver, selectors.EVENT_READ)
+                self._thread = threading.Thread(target=self._run, name='sttcp-writer', daemon=True)
+                self._thread.start()
+            self._scheduled.add(writer)
+        try:
+            self._wakeup_sender.send(b'\0')
+        except OSError:
+            pass
+
+    def _reset(self):
+        """Forgets the thread and writers of the parent process after `fork`"""
+        if self._selector is not None:
+            self._selector.close()
+            self._wakeup_receiver.close()
+            self._wakeup_sender.close()
+        self._lock = threading.Lock()
+        self._scheduled = set()
+        self._thread = None
+        self._selector = None
+        self._wakeup_receiver = self._wakeup_sender = None
+
+    def _run(self):
+        selector = self._selector
+        while True:
+            with self._lock:
+                scheduled = self._scheduled
+                self._scheduled = set()
+
+            for writer in scheduled:
+                fd = writer.fileno
+                key = selector.get_map().get(fd)
+                if writer.closed:
+                    if key is not None and key.data is writer:
+                        selector.unregister(fd)
+                    continue
+                if key is not None:
+                    if key.data is writer:
+                        continue
+                    selector.unregister(fd)
+                try:
+                    selector.register(fd, selectors.EVENT_WRITE, writer)
+                except (OSError, ValueError) as e:
+                    self._drop(writer, e)
+
+            for key, mask in selector.select():
+                if key.fileobj is self._wakeup_receiver:
+                    try:
+                        while self._wakeup_receiver.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                try:
+                    done = key.data.send_ready()
+                except Exception as e:
+                    self._drop(key.data, e)
+                    done = True
+                if done:
+                    selector.unregister(key.fd)
+
+    @staticmethod
+    def _drop(writer: 'Writer', error: Exception):
+        """Fails a writer whose socket can't be used, so the thread keeps serving other writers"""
+        with writer._condition:
+            writer._fail(error)
+
+
+_flusher = _Flusher()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_flusher._reset)
+
+
+class Writer:
+    def __init__(self, sock: socket.socket, high_watermark: int = 1024 * 1024, low_watermark: int = 256 * 1024):
+        """
+        Outbound queue of one connection. `write` only queues data, which is sent by one shared background thread when
+        the socket is writable, so a slow reader doesn't block the handler. Small writes queued at the same time are
+        sent by one `sendmsg` call.
+        When more than `high_watermark` bytes are queued `write` waits until the queue is drained below `low_watermark`.
+        """
+        if low_watermark > high_watermark:
+            raise ValueError('low_watermark must not be bigger than high_watermark')
+
+        self.socket = sock
+        self.fileno = sock.fileno()
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.closed = False
+        self.error = None
+
+        self._chunks = deque()
+        self._size = 0
+        self._scheduled = False
+        self._condition = threading.Condition()
+
+    @property
+    def pending(self) -> int:
+        """Amount of queued bytes"""
+        return self._size
+
+    @property
+    def writable(self) -> bool:
+        """False while the queue is above the high watermark"""
+        return self._size < self.high_watermark
+
+    def write(self, data: Union[bytes, bytearray, memoryview], block: bool = True,
+              timeout: Union[float, None] = None) -> bool:
+        """
+        Queues `data`.
+        :param block: Wait while the queue is above the high watermark. If False data is not queued in this case
+        :param timeout: Maximum time to wait
+        :return: False if data was not queued because of the high watermark
+        """
+        if not isinstance(data, bytes):
+            data = bytes(data)
+        if not data:
+            return True
+
+        with self._condition:
+            if self._size >= self.high_watermark:
+                if not block:
+                    return False
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self._size > self.low_watermark and not self.closed:
+                    left = None if deadline is None else deadline - time.monotonic()
+                    if left is not None and left <= 0:
+                        return False
+                    self._condition.wait(left)
+
+            if self.closed:
+                raise WriterClosedError('Writer is closed') from self.error
+
+            self._chunks.append(data)
+            self._size += len(data)
+            schedule = not self._scheduled
+            self._scheduled = True
+
+        if schedule:
+            _flusher.schedule(self)
+        return True
+
+    def send_ready(self) -> bool:
+        """
+        Sends as much queued data as possible without blocking. Called by the flusher thread.
+        :return: True if nothing is left to send
+        """
+        with self._condition:
+            try:
+                while self._chunks:
+                    batch = [self._chunks[index] for index in range(min(len(self._chunks), _IOV_MAX))]
+                    if _DONTWAIT and hasattr(self.socket, 'sendmsg'):
+                        sent = self.socket.sendmsg(batch, (), _DONTWAIT)
+                    else:
+                        sent = self.socket.send(b''.join(batch))
+                    self._consume(sent)
+            except (BlockingIOError, InterruptedError):
+                return False
+            except OSError as e:
+                self._fail(e)
+                return True
+            finally:
+                if self._size <= self.low_watermark or self.closed:
+                    self._condition.notify_all()
+
+            self._scheduled = False
+            return True
+
+    def _consume(self, sent: int):
+        self._size -= sent
+        while sent:
+            chunk = self._chunks[0]
+            if sent >= len(chunk):
+                sent -= len(chunk)
+                self._chunks.popleft()
+            else:
+                self._chunks[0] = memoryview(chunk)[sent:]
+                sent = 0
+
+    def _fail(self, error: Exception):
+        self.error = error
+        self.closed = True
+        self._chunks.clear()
+        self._size = 0
+        self._scheduled = False
+        self._condition.notify_all()
+
+    def flush(self, timeout: Union[float, None] = None) -> bool:
+        """
+        Blocks until every queued byte is sent.
+        :return: False if timeout expired or sending failed
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: not self._size or self.closed, timeout):
+                return False
+            return self.error is None
+
+    def close(self, flush: bool = True, timeout: Union[float, None] = 5.0) -> None:
+        """
+        Stops accepting new data. The socket is not closed.
+        :param flush: Wait until queued data is sent
+        :param timeout: Maximum time to wait for flushing
+        """
+        if flush:
+            self.flush(timeout)
+        with self._condition:
+            if self.closed:
+                return
+            self.closed = True
+            self._chunks.clear()
+            self._size = 0
+            self._condition.notify_all()
+        _flusher.schedule(self)
@@ -0,0 +1,32 @@
+import unittest
+
+from src.sttcp.admission import AdmissionControl
+
+
+class AdmissionControlTest(unittest.TestCase):
+    def test_reconnecting_keeps_rate_limit(self):
+        admission = AdmissionControl(bytes_per_second=1000, throttle=False)
+
+        limited = False
+        for port in range(20):
+            addr = ('127.0.0.1', 50000 + port)
+            self.assertTrue(admission.admit(addr))
+            delay = admission.limit(addr, 900, 0)
+            admission.release(addr)
+            if delay < 0:
+                limited = True
+                break
+
+        self.assertTrue(limited)
+        self.assertEqual(admission.stats()['limited'], 1)
+
+    def test_idle_peer_is_forgotten(self):
+        admission = AdmissionControl(bytes_per_second=1000, throttle=False)
+        addr = ('127.0.0.1', 50000)
+        admission.admit(addr)
+        admission.release(addr)
+        self.assertEqual(admission.stats()['peers'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
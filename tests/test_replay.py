@@ -0,0 +1,80 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from src.sttcp.server import Server
+from src.sttcp.transport import Loopback
+from src.sttcp import replay
+
+
+class RecordReplayTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'session.rec')
+
+    def _server(self, **options) -> Server:
+        server = Server('replay', 0, transport=Loopback(), **options)
+        received = []
+        lock = threading.Lock()
+
+        @server.connection_handler
+        def connection_handler(addr, connection):
+            return True
+
+        @server.receive_handler
+        def receive_handler(addr, connection, data):
+            with lock:
+                received.append(bytes(data))
+            connection.sendall(data)
+
+        server.received = received
+        server.start()
+        self.assertTrue(server.wait_listening(5))
+        return server
+
+    def test_replayed_traffic_matches_recording(self):
+        recorder = replay.Recorder(self.path)
+        server = self._server(recorder=recorder)
+        transport = Loopback()
+        for message in (b'first', b'second'):
+            sock = transport.create_socket()
+            transport.connect(sock, server.sock_name)
+            sock.sendall(message)
+            self.assertEqual(sock.recv(64), message)
+            sock.shutdown(socket.SHUT_WR)
+            self.assertEqual(sock.recv(64), b'')
+            sock.close()
+        server.close()
+        self.assertTrue(server.wait_closed(5))
+        self.assertTrue(server.clients.wait_empty(5))
+
+        events = list(replay.load(self.path))
+        self.assertEqual([kind for kind, _, _, _ in events], [replay.OPENED, replay.RECEIVED, replay.CLOSED] * 2)
+        self.assertEqual(b''.join(data for _, _, _, data in events), b'firstsecond')
+
+        target = self._server()
+        try:
+            result = replay.replay(self.path, *target.sock_name, speed=None, transport=Loopback(), timeout=5)
+        finally:
+            target.close()
+            target.wait_closed(5)
+
+        self.assertEqual(result['connections'], 2)
+        self.assertEqual(result['failed'], 0)
+        self.assertEqual(result['bytes_sent'], len(b'firstsecond'))
+        self.assertEqual(result['bytes_received'], len(b'firstsecond'))
+        self.assertEqual(sorted(target.received), [b'first', b'second'])
+
+    def test_server_closes_recorder(self):
+        recorder = replay.Recorder(self.path)
+        server = self._server(recorder=recorder)
+        server.close()
+        self.assertTrue(server.wait_closed(5))
+        self.assertTrue(recorder._file.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()